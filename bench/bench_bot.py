@@ -0,0 +1,360 @@
+"""
+离线压测工具：在本地启动模拟的面板 API 和模拟的 Telegram Bot API，
+让 bot.py 的 Application 处理多个模拟用户的点击流，并统计吞吐量和延迟。
+
+用法示例:
+    python bench/bench_bot.py --users 20 --rounds 5 --panel-latency 50
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from telegram import Update  # noqa: E402
+
+FAKE_TOKEN = "123456:BENCHMARK-TOKEN"
+
+
+# --- 极简 HTTP 服务 (支持 keep-alive) ---
+class MiniHTTPServer:
+    def __init__(self, handler):
+        self.handler = handler
+        self.server = None
+        self.port = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    key, _, value = line.decode("latin-1").partition(":")
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0) or 0))
+                status, payload, content_type = await self.handler(method, target, headers, body, writer)
+                if status is None:
+                    break  # 处理器自己接管了连接 (例如 SSE)
+                data = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+                writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\nContent-Length: {len(data)}\r\n\r\n".encode("latin-1") + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+# --- 模拟面板 ---
+class MockPanel:
+    def __init__(self, profiles: int, instances: int, running: int, completed: int, latency: float, batch: bool, events: bool):
+        self.latency = latency
+        self.batch = batch
+        self.events = events
+        self.event_log = []           # (event_id, data)，用于 Last-Event-ID 续传
+        self.event_subscribers = set()
+        self.requests = 0
+        self.profiles = [f"acc-{i}" for i in range(1, profiles + 1)]
+        states = ["RUNNING", "STOPPED"]
+        self.instances = {
+            alias: [{"id": f"{alias}-i{j}", "display_name": f"{alias}-vm{j}", "lifecycle_state": states[j % 2],
+                     "shape": "VM.Standard.A1.Flex" if j % 2 else "VM.Standard.E2.1.Micro", "vnic_id": f"vnic-{j}"}
+                    for j in range(instances)]
+            for alias in self.profiles
+        }
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        self.running = [{"id": f"r{i}", "name": f"snatch-{i}", "account_alias": random.choice(self.profiles), "status": "running",
+                         "result": json.dumps({"details": {"shape": "VM.Standard.A1.Flex", "ocpus": 4, "memory_in_gbs": 24},
+                                               "start_time": now, "attempt_count": i})}
+                        for i in range(running)]
+        self.completed = [{"id": f"c{i}", "name": f"snatch-{i}", "account_alias": random.choice(self.profiles),
+                           "status": "success" if i % 3 else "failure", "completed_at": now,
+                           "result": f"实例已创建\n可用区: AD-{i % 3}\n公网IP: 10.0.{i // 250}.{i % 250}",
+                           "details": json.dumps({"shape": "VM.Standard.E2.1.Micro"})}
+                          for i in range(completed)]
+        self.task_polls = {}
+        self.task_ids = itertools.count(1)
+
+    async def handle(self, method, target, headers, body, writer):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        path = urlsplit(target).path.removeprefix("/api/v1/oci/")
+        payload = json.loads(body) if body else {}
+        if path == "profiles":
+            return "200 OK", self.profiles, "application/json"
+        if path == "tasks/snatch/running":
+            return "200 OK", self.running, "application/json"
+        if path.startswith("tasks/snatch/completed"):
+            since_id = parse_qs(urlsplit(target).query).get("since_id", [None])[0]
+            ids = [task["id"] for task in self.completed]
+            if since_id in ids:
+                # 增量同步：只返回比 since_id 更新的任务 (列表按从新到旧排列)
+                return "200 OK", self.completed[:ids.index(since_id)], "application/json"
+            return "200 OK", self.completed, "application/json"
+        if path == "task-status/batch":
+            if not self.batch:
+                return "404 Not Found", {"error": "not found"}, "application/json"
+            return "200 OK", {task_id: self._task_status(task_id) for task_id in payload.get("task_ids", [])}, "application/json"
+        if path.startswith("task-status/"):
+            return "200 OK", self._task_status(path.split("/", 1)[1]), "application/json"
+        if path == "task-events":
+            if not self.events:
+                return "404 Not Found", {"error": "not found"}, "application/json"
+            await self._stream_events(headers, writer)
+            return None, None, None
+        alias, _, action = path.rpartition("/")
+        if action == "instances" and alias in self.instances:
+            return "200 OK", self.instances[alias], "application/json"
+        if action in ("instance-action", "snatch-instance", "create-instance"):
+            task_id = f"t{next(self.task_ids)}"
+            if self.events:
+                asyncio.get_running_loop().call_later(0.05, self._publish, {"task_id": task_id, "status": "success", "result": "ok"})
+            return "200 OK", {"task_id": task_id}, "application/json"
+        return "404 Not Found", {"error": f"unknown endpoint {path}"}, "application/json"
+
+    def _publish(self, data):
+        event = (len(self.event_log) + 1, json.dumps(data))
+        self.event_log.append(event)
+        for queue in self.event_subscribers:
+            queue.put_nowait(event)
+
+    async def _stream_events(self, headers, writer):
+        """SSE 替身：先补发 Last-Event-ID 之后的事件，再实时推送，空闲时发送心跳。"""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        last_id = int(headers.get("last-event-id", 0) or 0)
+        queue = asyncio.Queue()
+        for event in self.event_log[last_id:]:
+            queue.put_nowait(event)
+        self.event_subscribers.add(queue)
+        try:
+            while True:
+                try:
+                    event_id, data = await asyncio.wait_for(queue.get(), timeout=15)
+                    writer.write(f"id: {event_id}\nevent: task\ndata: {data}\n\n".encode("utf-8"))
+                except asyncio.TimeoutError:
+                    writer.write(b": ping\n\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.event_subscribers.discard(queue)
+
+    def _task_status(self, task_id):
+        polls = self.task_polls[task_id] = self.task_polls.get(task_id, 0) + 1
+        return {"status": "success" if polls >= 2 else "running", "result": "ok"}
+
+
+# --- 模拟 Telegram Bot API ---
+class MockTelegram:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = {}
+        self.message_ids = itertools.count(1000)
+
+    async def handle(self, method, target, headers, body, writer):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        api_method = target.rsplit("/", 1)[-1]
+        self.calls[api_method] = self.calls.get(api_method, 0) + 1
+        params = {}
+        if headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+            for key, values in parse_qs(body.decode("utf-8")).items():
+                try: params[key] = json.loads(values[0])
+                except ValueError: params[key] = values[0]
+        if api_method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot",
+                      "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": True}
+        elif api_method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            message_id = params.get("message_id") or next(self.message_ids)
+            result = {"message_id": message_id, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", "")}
+        else:
+            result = True
+        return "200 OK", {"ok": True, "result": result}, "application/json"
+
+
+# --- 模拟用户 ---
+def make_user(user_id: int):
+    return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+def start_update(update_id: int, user_id: int):
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "from": make_user(user_id),
+        "chat": {"id": user_id, "type": "private"}, "text": "/start",
+        "entities": [{"type": "bot_command", "offset": 0, "length": 6}]}}
+
+def text_update(update_id: int, user_id: int, text: str):
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "from": make_user(user_id),
+        "chat": {"id": user_id, "type": "private"}, "text": text}}
+
+def inline_update(update_id: int, user_id: int, query: str):
+    return {"update_id": update_id, "inline_query": {
+        "id": str(update_id), "from": make_user(user_id), "query": query, "offset": ""}}
+
+def callback_update(update_id: int, user_id: int, data: str):
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": make_user(user_id), "chat_instance": str(user_id), "data": data,
+        "message": {"message_id": 1, "date": int(time.time()), "chat": {"id": user_id, "type": "private"}, "text": "menu"}}}
+
+def click_stream(profiles):
+    alias = random.choice(profiles)
+    return [
+        None,                                   # /start
+        f"account:{alias}",
+        "exec:0",
+        "perform_action:RESTART",
+        f"back:account:{alias}",
+        "back:main",
+        "tasks:running:1",
+        "tasks:running:2",
+        "live:running:1",
+        "tasks:completed:1",
+        "tasks:completed:2",
+        "tasks:completed:3",
+        "tf:status:failure",
+        "tasks:stats:1",
+        f"account:{alias}",
+        "back:main",
+        "main:2",
+        ("inline", alias[:5]),                  # @bot 账户名前缀
+        ("text", f"/account {alias}"),          # 选中内联结果后发送的消息
+    ]
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run_benchmark(args):
+    panel = MockPanel(args.profiles, args.instances, args.running, args.completed, args.panel_latency / 1000, not args.no_batch, not args.no_events)
+    telegram = MockTelegram(args.telegram_latency / 1000)
+    panel_server, telegram_server = MiniHTTPServer(panel.handle), MiniHTTPServer(telegram.handle)
+    await panel_server.start()
+    await telegram_server.start()
+
+    workdir = tempfile.mkdtemp(prefix="tgbot-bench-")
+    bot.BOT_TOKEN = FAKE_TOKEN
+    bot.BASE_URL = f"http://127.0.0.1:{panel_server.port}/api/v1/oci"
+    bot.DB_PATH = os.path.join(workdir, "bench.db")
+    bot.METRICS_PORT = 0
+    bot.SESSION_PERSISTENCE = not args.no_persistence
+    bot.TG_GLOBAL_RATE = bot.TG_GLOBAL_BURST = args.tg_rate
+    bot.TG_CHAT_RATE, bot.TG_CHAT_BURST = args.tg_rate, args.tg_rate
+    user_ids = list(range(10_000, 10_000 + args.users))
+    bot.AUTHORIZED_USER_IDS = user_ids
+
+    application = bot.build_application(base_url=f"http://127.0.0.1:{telegram_server.port}/bot")
+    await application.initialize()
+    await application.post_init(application)
+    await application.start()
+
+    update_ids = itertools.count(1)
+    latencies = []
+
+    async def simulate(user_id):
+        for _ in range(args.rounds):
+            for data in click_stream(panel.profiles):
+                update_id = next(update_ids)
+                if data is None:
+                    raw = start_update(update_id, user_id)
+                elif isinstance(data, tuple):
+                    kind, text = data
+                    raw = inline_update(update_id, user_id, text) if kind == "inline" else text_update(update_id, user_id, text)
+                else:
+                    raw = callback_update(update_id, user_id, data)
+                update = Update.de_json(raw, application.bot)
+                started = time.perf_counter()
+                # 与线上一致，经过 Application 的并发更新处理器 (按会话串行)
+                await application.update_processor.process_update(update, application.process_update(update))
+                latencies.append(time.perf_counter() - started)
+                if args.think_time:
+                    await asyncio.sleep(random.uniform(0, args.think_time / 1000))
+
+    panel.requests = 0
+    started = time.perf_counter()
+    await asyncio.gather(*(simulate(user_id) for user_id in user_ids))
+    elapsed = time.perf_counter() - started
+    panel_requests = panel.requests
+
+    await application.stop()
+    await application.shutdown()
+    await application.post_shutdown(application)
+    await panel_server.stop()
+    await telegram_server.stop()
+
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    report = {
+        "updates": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "updates_per_s": round(len(latencies) / elapsed, 1) if elapsed else 0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0,
+        "panel_requests": panel_requests,
+        "panel_requests_per_update": round(panel_requests / len(latencies), 3) if latencies else 0,
+        "task_events_pushed": len(panel.event_log),
+        "telegram_calls": dict(sorted(telegram.calls.items())),
+        "peak_rss_mb": round(peak_rss_mb, 1),
+    }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="bot.py 离线压测")
+    parser.add_argument("--users", type=int, default=10, help="模拟用户数")
+    parser.add_argument("--rounds", type=int, default=3, help="每个用户重复点击流的次数")
+    parser.add_argument("--profiles", type=int, default=20, help="模拟面板中的账户数")
+    parser.add_argument("--instances", type=int, default=6, help="每个账户的实例数")
+    parser.add_argument("--running", type=int, default=20, help="运行中的抢占任务数")
+    parser.add_argument("--completed", type=int, default=2000, help="已完成的任务数")
+    parser.add_argument("--panel-latency", type=float, default=20, help="面板接口的模拟延迟 (毫秒)")
+    parser.add_argument("--telegram-latency", type=float, default=5, help="Bot API 的模拟延迟 (毫秒)")
+    parser.add_argument("--think-time", type=float, default=0, help="用户两次点击之间的最大随机间隔 (毫秒)")
+    parser.add_argument("--tg-rate", type=float, default=1000, help="压测时 Telegram 发送队列的限速 (每秒)，默认放开限速")
+    parser.add_argument("--no-batch", action="store_true", help="模拟不支持批量任务状态接口的面板")
+    parser.add_argument("--no-events", action="store_true", help="模拟不提供任务事件流 (SSE) 的面板，任务状态只能轮询")
+    parser.add_argument("--no-persistence", action="store_true", help="关闭会话持久化")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    report = asyncio.run(run_benchmark(args))
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return
+    for key, value in report.items():
+        print(f"{key:>28}: {value}")
+
+
+if __name__ == "__main__":
+    main()
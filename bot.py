@@ -1,14 +1,31 @@
+from __future__ import annotations
+
 import asyncio
+import bisect
+import contextvars
+import functools
+import hashlib
+import heapq
 import httpx
 import logging
 import json
+import os
+import random
 import re
+import secrets
+import sqlite3
+import time
+import zlib
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from typing import List, Dict, Any
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand, MenuButtonDefault
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, BotCommand, MenuButtonDefault, InlineQueryResultArticle, InputTextMessageContent
+from telegram.ext import Application, BasePersistence, BaseUpdateProcessor, CommandHandler, CallbackQueryHandler, ContextTypes, InlineQueryHandler, MessageHandler, PersistenceInput, filters
 from telegram.constants import ParseMode
-from telegram.error import BadRequest
+from telegram.error import BadRequest, RetryAfter
+from telegram.request import HTTPXRequest
 
 # --- 1. 配置信息 ---
 PANEL_URL = "Your Panel URL Placeholder"
@@ -16,6 +33,146 @@ PANEL_API_KEY = "Your API Key Placeholder"
 BOT_TOKEN = "Your Bot Token Placeholder"
 AUTHORIZED_USER_IDS = [123456789]
 TASKS_PER_PAGE = 2
+TASK_SNAPSHOT_TTL = 60            # 任务列表翻页快照的有效期 (秒)
+TASK_SNAPSHOT_MAX_ENTRIES = 200   # 最多保存的任务列表快照数 (每个用户每个视图一份)
+TASK_RENDER_CACHE_SIZE = 1024     # 任务渲染结果缓存的最大条目数
+
+# --- 运行模式配置 ---
+BOT_MODE = "polling"              # "polling" 使用长轮询；"webhook" 使用 Webhook (需要 python-telegram-bot[webhooks])
+WEBHOOK_LISTEN = "127.0.0.1"      # Webhook 本地监听地址 (通常由 Nginx 等反向代理转发)
+WEBHOOK_PORT = 8443               # Webhook 本地监听端口
+WEBHOOK_PATH = "tgbot"            # Webhook 的 URL 路径
+WEBHOOK_URL = ""                  # 对外的 https 地址，例如 https://bot.example.com/tgbot；Webhook 模式下必须填写
+WEBHOOK_SECRET_TOKEN = ""         # Telegram 回调时携带的密钥，留空则每次启动随机生成
+WEBHOOK_MAX_CONNECTIONS = 40      # 允许 Telegram 同时建立的最大连接数 (1-100)
+UPDATE_QUEUE_SIZE = 1000          # 待处理更新队列的容量，队列满时新的更新会等待
+MAX_PENDING_UPDATES = 256         # 已取出但尚未处理完的更新数上限，达到后暂停从队列取更新
+MAX_CONCURRENT_UPDATES = 32       # 同时处理的更新数上限；同一会话的更新始终按顺序逐个处理
+
+# --- 面板 API 连接配置 ---
+PANEL_MAX_CONNECTIONS = 50        # 连接池最大连接数
+PANEL_MAX_KEEPALIVE = 20          # 最多保持的空闲长连接数
+PANEL_KEEPALIVE_EXPIRY = 60.0     # 空闲长连接的保活时间 (秒)
+PANEL_HTTP2 = False               # 是否启用 HTTP/2 (需要安装 httpx[http2])
+PANEL_CONNECT_TIMEOUT = 10.0      # 建立连接的超时时间 (秒)
+# 按接口区分的读取超时 (秒)，未列出的接口使用 "default"
+PANEL_TIMEOUTS = {
+    "default": 30.0,
+    "profiles": 10.0,
+    "instances": 20.0,
+    "task-status": 10.0,
+    "tasks/snatch/running": 20.0,
+    "tasks/snatch/completed": 30.0,
+    "instance-action": 30.0,
+    "snatch-instance": 30.0,
+    "create-instance": 30.0,
+}
+
+# --- 面板调用容错配置 ---
+PANEL_BREAKER_FAILURES = 5        # 同一接口连续失败多少次后熔断 (超时、连接错误和 5xx 计为失败)
+PANEL_BREAKER_RESET = 30          # 熔断后经过多少秒放行一个探测请求，成功则恢复
+PANEL_RETRY_ATTEMPTS = 3          # GET 请求的最多尝试次数 (写操作从不重试)
+PANEL_RETRY_BASE_DELAY = 0.3      # 重试的基础等待时间 (秒)，按指数增长并加入随机抖动
+PANEL_RETRY_MAX_DELAY = 3.0       # 单次重试的最长等待时间 (秒)
+INTERACTION_DEADLINE = 20         # 一次用户操作 (点击按钮或命令) 内所有面板请求的总时限 (秒)
+
+# --- 回调数据配置 ---
+CALLBACK_DATA_LIMIT = 64          # Telegram 对 callback_data 的字节数限制
+CALLBACK_INLINE_ARG_MAX = 24      # 超过该字节数的参数 (如较长的账户名) 会被替换为短 ID
+
+MENU_CACHE_SIZE = 256             # 参数化菜单 (分页、参数表单等) 的缓存条目数
+
+# --- 账户选择配置 ---
+ACCOUNTS_PER_PAGE = 20            # 主菜单每页显示的账户数 (每行两个)
+INLINE_QUERY_RESULTS = 20         # 内联查询 (@机器人 账户名) 最多返回的账户数
+INLINE_QUERY_CACHE_TIME = 10      # Telegram 缓存内联查询结果的时间 (秒)
+
+# --- 批量操作配置 ---
+BULK_ACTION_CONCURRENCY = 5       # 批量操作时同时向面板提交的实例操作数
+
+# --- 账户总览配置 ---
+FLEET_CONCURRENCY = 8             # 汇总所有账户实例时的并发请求数
+FLEET_ACCOUNT_TIMEOUT = 15.0      # 单个账户获取实例列表的超时时间 (秒)，超时的账户不会阻塞其他账户
+
+# --- Telegram 发送队列配置 ---
+TG_GLOBAL_RATE = 30.0             # 全局每秒最多调用的发送类接口次数
+TG_GLOBAL_BURST = 30              # 全局允许的突发次数
+TG_CHAT_RATE = 1.0                # 单个会话每秒最多发送/编辑的消息数
+TG_CHAT_BURST = 3                 # 单个会话允许的突发次数
+TG_MAX_RETRIES = 3                # 遇到 429 (RetryAfter) 时的最大重试次数
+
+# --- 本地存储与临时消息配置 ---
+DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tgbot.db")  # 本地 SQLite 数据库
+# 各类临时消息的自动删除时间 (秒)，未列出的类型使用 "default"
+EPHEMERAL_TTLS = {
+    "default": 5,
+    "feedback": 5,                # 命令已发送等操作反馈
+    "warning": 5,                 # 危险操作的二次确认提示 (与确认窗口一致)
+    "error": 8,                   # 错误提示
+    "submitted": 10,              # 任务提交成功提示
+    "nav": 3,                     # "正在返回..." 一类的导航提示
+}
+
+# --- 会话持久化配置 ---
+SESSION_PERSISTENCE = True        # 是否将用户的菜单会话保存到本地数据库，重启后可继续操作
+SESSION_PERSIST_INTERVAL = 10     # 会话数据写入数据库的间隔 (秒)
+SESSION_IDLE_TTL = 7 * 86400      # 会话闲置超过该时间 (秒) 后被清理
+# 需要持久化的会话字段，其余字段 (如任务列表快照) 只保存在内存中
+SESSION_PERSIST_KEYS = ('current_alias', 'alias', 'action_in_progress', 'instance_list', 'selected_instance_for_action', 'form_data', 'pending_confirmation', 'bulk_selected', 'task_filter', 'recent_aliases')
+# 会话中为每个实例保存的字段
+INSTANCE_SESSION_FIELDS = ('id', 'display_name', 'lifecycle_state', 'vnic_id')
+
+# --- 任务状态跟踪配置 ---
+TASK_POLL_TIMEOUT = 600           # 单个任务的最长跟踪时间 (秒)，超时后发送超时通知
+# 按任务年龄自适应的查询间隔: (任务年龄上限秒数, 查询间隔秒数)，None 表示不设上限
+TASK_POLL_INTERVALS = [(60, 5), (300, 10), (None, 20)]
+TASK_STATUS_MAX_QPS = 10          # 任务状态查询的全局 QPS 上限 (一次批量查询计为一次)
+TASK_STATUS_CONCURRENCY = 5       # 面板不支持批量接口时的并发查询数
+TASK_STATUS_BATCH_SIZE = 50       # 每次批量查询的最大任务数
+TASK_NOTIFY_SUCCESS = True        # 事件流推送任务成功时也发送通知；轮询得到的成功结果仍由面板负责通知
+
+# --- 任务事件推送配置 ---
+# 面板的任务状态事件流 (Server-Sent Events)，设为 None 则只使用轮询
+TASK_EVENTS_ENDPOINT = "task-events"
+TASK_EVENTS_READ_TIMEOUT = 90     # 超过该时间未收到任何数据 (包括心跳) 视为断线 (秒)
+TASK_EVENTS_RECONNECT_DELAYS = (1, 2, 5, 10, 30)  # 断线后依次使用的重连等待时间 (秒)
+TASK_EVENTS_UNAVAILABLE_RETRY = 300  # 面板不支持事件流时，再次尝试连接的间隔 (秒)
+TASK_EVENTS_FALLBACK_POLL = 60    # 事件流连接正常时，兜底轮询的最短间隔 (秒)
+# --- 实时任务面板配置 ---
+LIVE_REFRESH_INTERVAL = 10        # 实时面板的刷新间隔 (秒)，观看同一视图的所有会话共用一次查询
+LIVE_IDLE_TIMEOUT = 600           # 会话内超过该时间 (秒) 没有任何操作时自动暂停实时刷新
+
+# --- 预取配置 ---
+PREFETCH = True                   # 在后台预取用户接下来可能查看的数据 (账户实例列表、任务列表等)
+PREFETCH_CONCURRENCY = 2          # 预取同时进行的面板请求数上限，避免挤占用户操作
+PREFETCH_MAX_PENDING = 20         # 排队中的预取任务上限，超出时放弃新的预取
+PREFETCH_RECENT_ACCOUNTS = 3      # 回到主菜单时预取最近使用的几个账户的实例列表
+
+# --- 已完成任务归档配置 ---
+TASK_ARCHIVE = True               # 将已完成的任务归档到本地数据库，已完成任务列表从本地查询并支持筛选与统计
+TASK_ARCHIVE_SYNC_INTERVAL = 30   # 两次增量同步的最短间隔 (秒)，点击刷新时立即同步
+# 增量同步时附带的查询参数: since_id 为本地最新任务的 ID，since 为其完成时间。
+# 面板忽略这些参数而返回完整列表时同样可用，只是无法节省流量。
+TASK_ARCHIVE_SINCE_PARAMS = ("since_id", "since")
+TASK_STATS_MAX_ACCOUNTS = 30      # 统计页面最多列出的账户数
+
+# --- 面板读缓存配置 ---
+PANEL_CACHE_MAX_ENTRIES = 512     # 缓存的最大条目数，超出后按 LRU 淘汰
+# 按接口区分的缓存时间 (秒): (新鲜期, 过期后仍可先返回旧数据并在后台刷新的时长)
+# 未列出的接口 (如 task-status) 不缓存
+PANEL_CACHE_TTLS = {
+    "profiles": (300, 3600),
+    "instances": (30, 300),
+    "tasks/snatch/running": (10, 60),
+    "tasks/snatch/completed": (30, 300),
+}
+# 面板的批量状态查询接口 (POST {"task_ids": [...]})，设为 None 则始终逐个查询
+PANEL_BATCH_STATUS_ENDPOINT = "task-status/batch"
+
+# --- 监控指标配置 ---
+METRICS_LISTEN = "127.0.0.1"      # Prometheus 指标接口的监听地址
+METRICS_PORT = 9108               # 指标接口端口 (GET /metrics)，设为 0 则关闭
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
 
 # --- 日志配置 ---
 logging.basicConfig(format="%(asctime)s - %(name)s - %(levelname)s - %(message)s", level=logging.INFO)
@@ -44,44 +201,897 @@ def format_elapsed_time_tg(start_time_str: str) -> str:
     except (ValueError, TypeError):
         return "未知"
 
-def create_title_bar(title: str) -> List[InlineKeyboardButton]:
-    return [InlineKeyboardButton(f"❖ {title} ❖", callback_data="ignore")]
+# 菜单按钮在 PTB 中是不可变对象，可以在多次渲染之间安全共享
+@functools.lru_cache(maxsize=MENU_CACHE_SIZE)
+def create_title_bar(title: str) -> tuple:
+    return (InlineKeyboardButton(f"❖ {title} ❖", callback_data="ignore"),)
+
+_FOOTER_RULER = (
+    (
+        InlineKeyboardButton("─────« Cloud", callback_data="ignore"),
+        InlineKeyboardButton("Manager »────", callback_data="ignore")
+    ),
+)
+_FOOTER_RULER_WITH_CLOSE = _FOOTER_RULER + ((InlineKeyboardButton("❌ 关闭窗口", callback_data="close_window"),),)
 
 # --- 修改点 1: 调整页脚函数，使其能接收参数，并且默认不显示关闭按钮 ---
-def get_footer_ruler(add_close_button: bool = False) -> List[List[InlineKeyboardButton]]:
+def get_footer_ruler(add_close_button: bool = False) -> tuple:
     """
-    生成菜单页脚。
+    生成菜单页脚 (启动时已预先构建)。
     :param add_close_button: 如果为 True，则在底部添加“关闭窗口”按钮。
     """
-    footer = [
-        [
-            InlineKeyboardButton("─────« Cloud", callback_data="ignore"),
-            InlineKeyboardButton("Manager »────", callback_data="ignore")
-        ]
-    ]
-    if add_close_button:
-        footer.append([InlineKeyboardButton("❌ 关闭窗口", callback_data="close_window")])
-    return footer
+    return _FOOTER_RULER_WITH_CLOSE if add_close_button else _FOOTER_RULER
+
+# --- 本地存储 ---
+_db_conn: sqlite3.Connection | None = None
+
+def get_db() -> sqlite3.Connection:
+    """
+    返回共享的 SQLite 连接，首次调用时创建数据库文件。
+    """
+    global _db_conn
+    if _db_conn is None:
+        _db_conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        _db_conn.execute("PRAGMA journal_mode=WAL")
+        _db_conn.execute("PRAGMA synchronous=NORMAL")
+    return _db_conn
+
+def close_db():
+    global _db_conn
+    if _db_conn is not None:
+        _db_conn.close()
+        _db_conn = None
+
+# --- 会话持久化 ---
+def compact_instance(instance: dict) -> dict:
+    """只保留菜单和实例操作需要的字段。"""
+    return {k: instance[k] for k in INSTANCE_SESSION_FIELDS if instance.get(k) is not None}
+
+# 返回主菜单等重置会话的操作不会清除的字段
+SESSION_KEEP_KEYS = ('recent_aliases',)
+
+def reset_session(user_data: dict):
+    kept = {k: user_data[k] for k in SESSION_KEEP_KEYS if k in user_data}
+    user_data.clear()
+    user_data.update(kept)
+
+def remember_account(user_data: dict, alias: str):
+    """记录最近打开的账户 (最新的在前)，供预取使用。"""
+    recent = [a for a in user_data.get('recent_aliases', []) if a != alias]
+    user_data['recent_aliases'] = [alias] + recent[:PREFETCH_RECENT_ACCOUNTS - 1]
+
+def encode_session(user_data: dict) -> bytes | None:
+    data = {k: user_data[k] for k in SESSION_PERSIST_KEYS if user_data.get(k) is not None}
+    if not data:
+        return None
+    pending = data.get('pending_confirmation')
+    if pending and isinstance(pending.get('timestamp'), datetime):
+        data['pending_confirmation'] = dict(pending, timestamp=pending['timestamp'].isoformat())
+    return zlib.compress(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+def decode_session(blob: bytes) -> dict:
+    data = json.loads(zlib.decompress(blob).decode('utf-8'))
+    pending = data.get('pending_confirmation')
+    if pending and isinstance(pending.get('timestamp'), str):
+        pending['timestamp'] = datetime.fromisoformat(pending['timestamp'])
+    return data
+
+class SQLitePersistence(BasePersistence):
+    """
+    将 context.user_data 保存到本地 SQLite。只保存 SESSION_PERSIST_KEYS 中的字段，
+    以压缩的 JSON 存储；同一轮中的多次写入合并为一个事务，闲置的会话会被清理。
+    """
+    FLUSH_DELAY = 0.5             # 合并写入的等待时间 (秒)
+
+    def __init__(self, update_interval: float = SESSION_PERSIST_INTERVAL):
+        super().__init__(store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False), update_interval=update_interval)
+        self._dirty: Dict[int, bytes | None] = {}
+        self._persisted: Dict[int, bytes] = {}
+        self._last_seen: Dict[int, float] = {}
+        self._flusher: asyncio.Task | None = None
+        self._sweeper: asyncio.Task | None = None
+        db = get_db()
+        db.execute("CREATE TABLE IF NOT EXISTS user_sessions (user_id INTEGER PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)")
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        db = get_db()
+        db.execute("DELETE FROM user_sessions WHERE updated_at < ?", (time.time() - SESSION_IDLE_TTL,))
+        sessions = {}
+        for user_id, blob, updated_at in db.execute("SELECT user_id, data, updated_at FROM user_sessions"):
+            try:
+                sessions[user_id] = decode_session(blob)
+            except (ValueError, zlib.error) as e:
+                logger.warning(f"无法读取用户 {user_id} 的会话数据: {e}")
+                continue
+            self._persisted[user_id] = blob
+            self._last_seen[user_id] = updated_at
+        if sessions:
+            logger.info(f"恢复了 {len(sessions)} 个用户会话。")
+        return sessions
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._last_seen[user_id] = time.time()
+        blob = encode_session(data)
+        if blob == self._persisted.get(user_id):
+            return
+        self._dirty[user_id] = blob
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._dirty[user_id] = None
+        self._last_seen.pop(user_id, None)
+        self._write_dirty()
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        pass
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.FLUSH_DELAY)
+        self._write_dirty()
+
+    def _write_dirty(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+        now = time.time()
+        try:
+            db = get_db()
+            db.execute("BEGIN")
+            db.executemany("DELETE FROM user_sessions WHERE user_id = ?", [(u,) for u, b in dirty.items() if b is None])
+            db.executemany("INSERT OR REPLACE INTO user_sessions (user_id, data, updated_at) VALUES (?, ?, ?)", [(u, b, now) for u, b in dirty.items() if b is not None])
+            db.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.error(f"保存会话数据时出错: {e}")
+            if get_db().in_transaction: get_db().execute("ROLLBACK")
+            return
+        for user_id, blob in dirty.items():
+            if blob is None: self._persisted.pop(user_id, None)
+            else: self._persisted[user_id] = blob
+
+    def start_sweeper(self, application: Application):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.create_task(self._sweep(application))
+
+    async def _sweep(self, application: Application):
+        """定期从内存和数据库中清理闲置的会话。"""
+        while True:
+            await asyncio.sleep(min(SESSION_IDLE_TTL, 3600))
+            deadline = time.time() - SESSION_IDLE_TTL
+            for user_id in [u for u, seen in self._last_seen.items() if seen < deadline]:
+                application.drop_user_data(user_id)
+                self._dirty[user_id] = None
+                self._last_seen.pop(user_id, None)
+            self._write_dirty()
+
+    async def flush(self) -> None:
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+        if self._flusher is not None and not self._flusher.done():
+            self._flusher.cancel()
+        self._write_dirty()
+
+    # 以下数据不做持久化
+    async def get_chat_data(self) -> Dict[int, dict]: return {}
+    async def get_bot_data(self) -> dict: return {}
+    async def get_callback_data(self): return None
+    async def get_conversations(self, name: str) -> dict: return {}
+    async def update_chat_data(self, chat_id: int, data: dict) -> None: pass
+    async def update_bot_data(self, data: dict) -> None: pass
+    async def update_callback_data(self, data) -> None: pass
+    async def update_conversation(self, name: str, key, new_state) -> None: pass
+    async def drop_chat_data(self, chat_id: int) -> None: pass
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None: pass
+    async def refresh_bot_data(self, bot_data: dict) -> None: pass
+
+# --- 监控指标 ---
+def _format_labels(labelnames, labelvalues, extra: str = "") -> str:
+    pairs = [f'{k}="{str(v)}"'.replace("\n", " ") for k, v in zip(labelnames, labelvalues)]
+    if extra: pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self._values: Dict[tuple, float] = {}
+        METRICS_REGISTRY.append(self)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(k, "") for k in self.labelnames)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=METRICS_LATENCY_BUCKETS):
+        self.name, self.documentation, self.labelnames = name, documentation, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values: Dict[tuple, list] = {}
+        METRICS_REGISTRY.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(k, "") for k in self.labelnames)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][i] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, (bucket_counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+class Gauge:
+    """取值时调用 getter 计算当前值的指标。"""
+    def __init__(self, name: str, documentation: str, getter):
+        self.name, self.documentation, self.getter = name, documentation, getter
+        METRICS_REGISTRY.append(self)
+
+    def collect(self) -> List[str]:
+        try: value = self.getter()
+        except Exception: return []
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge", f"{self.name} {value}"]
+
+METRICS_REGISTRY: List[Any] = []
+PANEL_REQUEST_LATENCY = Histogram("tgbot_panel_request_duration_seconds", "Latency of panel API requests.", ("endpoint", "method"))
+PANEL_REQUEST_ERRORS = Counter("tgbot_panel_request_errors_total", "Failed panel API requests.", ("endpoint", "method", "reason"))
+PANEL_REQUEST_RETRIES = Counter("tgbot_panel_request_retries_total", "Retried idempotent panel API requests.", ("endpoint",))
+HANDLER_LATENCY = Histogram("tgbot_handler_duration_seconds", "Latency of update handlers by callback command.", ("command",))
+TELEGRAM_API_LATENCY = Histogram("tgbot_telegram_api_duration_seconds", "Latency of Telegram Bot API requests by API method.", ("method",))
+TELEGRAM_RATE_LIMITED = Counter("tgbot_telegram_rate_limited_total", "Telegram 429 (RetryAfter) responses.", ("method",))
+
+def render_metrics() -> str:
+    lines = []
+    for metric in METRICS_REGISTRY:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+async def _handle_metrics_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render_metrics().encode("utf-8")
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_metrics_server():
+    if not METRICS_PORT:
+        return None
+    try:
+        server = await asyncio.start_server(_handle_metrics_connection, METRICS_LISTEN, METRICS_PORT)
+    except OSError as e:
+        logger.error(f"无法启动指标接口 {METRICS_LISTEN}:{METRICS_PORT}: {e}")
+        return None
+    logger.info(f"指标接口已启动: http://{METRICS_LISTEN}:{METRICS_PORT}/metrics")
+    return server
 
 # --- API 客户端  ---
 BASE_URL = f"{PANEL_URL}/api/v1/oci"
 HEADERS = {"Authorization": f"Bearer {PANEL_API_KEY}", "Content-Type": "application/json"}
 
-async def api_request(method: str, endpoint: str, **kwargs):
-    async with httpx.AsyncClient() as client:
+# 整个应用生命周期共用一个连接池，避免每次请求都重新进行 TCP+TLS 握手
+_panel_client: httpx.AsyncClient | None = None
+
+def endpoint_label(endpoint: str) -> str:
+    """
+    将具体的接口路径归一化为接口名称，例如 "abc/instances" -> "instances"，
+    "task-status/123" -> "task-status"。用于超时配置等按接口区分的设置。
+    """
+    path = endpoint.split("?", 1)[0]
+    if path.startswith("task-status/"): return "task-status"
+    if path.startswith("tasks/") or "/" not in path: return path
+    return path.rsplit("/", 1)[-1]
+
+def get_panel_client() -> httpx.AsyncClient:
+    global _panel_client
+    if _panel_client is None or _panel_client.is_closed:
+        http2 = PANEL_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("未安装 h2 库，已回退到 HTTP/1.1。如需 HTTP/2 请执行: pip install 'httpx[http2]'")
+                http2 = False
+        _panel_client = httpx.AsyncClient(
+            headers=HEADERS,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=PANEL_MAX_CONNECTIONS,
+                max_keepalive_connections=PANEL_MAX_KEEPALIVE,
+                keepalive_expiry=PANEL_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(PANEL_TIMEOUTS["default"], connect=PANEL_CONNECT_TIMEOUT),
+        )
+    return _panel_client
+
+async def close_panel_client():
+    global _panel_client
+    if _panel_client is not None:
+        await _panel_client.aclose()
+        _panel_client = None
+
+def get_endpoint_timeout(endpoint: str) -> httpx.Timeout:
+    read_timeout = PANEL_TIMEOUTS.get(endpoint_label(endpoint), PANEL_TIMEOUTS["default"])
+    return httpx.Timeout(read_timeout, connect=min(PANEL_CONNECT_TIMEOUT, read_timeout))
+
+# 当前用户操作的截止时间 (time.monotonic())，None 表示不限 (后台任务)
+panel_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("panel_deadline", default=None)
+
+@contextmanager
+def interaction_deadline(seconds: float = INTERACTION_DEADLINE):
+    token = panel_deadline.set(time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        panel_deadline.reset(token)
+
+def deadline_remaining() -> float | None:
+    deadline = panel_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+class CircuitBreaker:
+    """
+    单个接口的熔断器。连续失败达到阈值后熔断，期间请求直接失败；
+    熔断 PANEL_BREAKER_RESET 秒后进入半开状态，只放行一个探测请求，成功则恢复，失败则继续熔断。
+    """
+    def __init__(self):
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def retry_after(self) -> float:
+        if self.opened_at is None: return 0.0
+        return max(0.0, self.opened_at + PANEL_BREAKER_RESET - time.monotonic())
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self._probing or self.retry_after() > 0:
+            return False
+        self._probing = True
+        return True
+
+    def record(self, success: bool | None):
+        """记录一次请求的结果。success 为 None 表示结果与面板健康无关 (例如被取消)。"""
+        self._probing = False
+        if success is None:
+            return
+        if success:
+            if self.opened_at is not None:
+                logger.info("面板接口已恢复，熔断解除。")
+            self.failures, self.opened_at = 0, None
+            return
+        self.failures += 1
+        if self.opened_at is not None or self.failures >= PANEL_BREAKER_FAILURES:
+            if self.opened_at is None:
+                logger.warning(f"面板接口连续失败 {self.failures} 次，熔断 {PANEL_BREAKER_RESET} 秒。")
+            self.opened_at = time.monotonic()
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def get_breaker(endpoint: str) -> CircuitBreaker:
+    """按接口获取熔断器。账户相关的接口按账户区分，避免单个账户的故障影响其他账户。"""
+    label = endpoint_label(endpoint)
+    path = endpoint.split("?", 1)[0]
+    # 批量状态查询与逐个查询分开熔断，互不影响
+    key = label if (label == "task-status" and path != PANEL_BATCH_STATUS_ENDPOINT) or path.startswith("tasks/") else path
+    breaker = _breakers.get(key)
+    if breaker is None:
+        breaker = _breakers[key] = CircuitBreaker()
+    return breaker
+
+class PanelReadCache:
+    """
+    面板 GET 请求的读缓存：按接口设置 TTL，过期后在宽限期内先返回旧数据并在后台刷新，
+    超出容量按 LRU 淘汰；相同的并发请求只会实际发出一次。
+    """
+    def __init__(self, max_entries: int = PANEL_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple] = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._invalidated: set = set()
+        self._refreshers: set = set()
+
+    @staticmethod
+    def ttl_for(endpoint: str):
+        return PANEL_CACHE_TTLS.get(endpoint_label(endpoint))
+
+    async def get(self, endpoint: str, fetcher):
+        ttl = self.ttl_for(endpoint)
+        if ttl is None:
+            return await fetcher()
+        fresh, stale = ttl
+        entry = self._entries.get(endpoint)
+        if entry is not None:
+            age = time.monotonic() - entry[0]
+            if age < fresh + stale:
+                self._entries.move_to_end(endpoint)
+                if age >= fresh and endpoint not in self._inflight:
+                    refresher = asyncio.create_task(self._refresh(endpoint, fetcher))
+                    self._refreshers.add(refresher)
+                    refresher.add_done_callback(self._refreshers.discard)
+                return entry[1]
+        return await self._load(endpoint, fetcher)
+
+    def _age(self, endpoint: str) -> float | None:
+        entry = self._entries.get(endpoint)
+        return None if entry is None else time.monotonic() - entry[0]
+
+    def is_fresh(self, endpoint: str) -> bool:
+        ttl, age = self.ttl_for(endpoint), self._age(endpoint)
+        return ttl is not None and age is not None and age < ttl[0]
+
+    def is_usable(self, endpoint: str) -> bool:
+        """缓存中是否有可以立即返回的数据 (新鲜或仍在宽限期内)。"""
+        ttl, age = self.ttl_for(endpoint), self._age(endpoint)
+        return ttl is not None and age is not None and age < ttl[0] + ttl[1]
+
+    async def _refresh(self, endpoint: str, fetcher):
+        # 后台刷新不受触发它的用户操作的时限约束
+        panel_deadline.set(None)
+        return await self._load(endpoint, fetcher)
+
+    async def _load(self, endpoint: str, fetcher):
+        task = self._inflight.get(endpoint)
+        if task is None:
+            # 请求在缓存自己的任务中执行，某个调用方被取消不会影响其他等待同一结果的调用方
+            task = asyncio.create_task(self._fetch(endpoint, fetcher))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._inflight[endpoint] = task
+        # 共享的请求不受某个调用方的时限约束，每个调用方按自己剩余的时限等待
+        remaining = deadline_remaining()
+        if remaining is None:
+            return await asyncio.shield(task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), max(remaining, 0))
+        except asyncio.TimeoutError:
+            return {"error": "操作超时，面板响应过慢，请稍后重试。"}
+
+    async def _fetch(self, endpoint: str, fetcher):
+        panel_deadline.set(None)
+        task = asyncio.current_task()
+        try:
+            value = await fetcher()
+        finally:
+            if self._inflight.get(endpoint) is task:
+                del self._inflight[endpoint]
+            invalidated = task in self._invalidated
+            self._invalidated.discard(task)
+        if not invalidated and not (isinstance(value, dict) and "error" in value):
+            self._store(endpoint, value)
+        return value
+
+    def _store(self, endpoint: str, value):
+        self._entries[endpoint] = (time.monotonic(), value)
+        self._entries.move_to_end(endpoint)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, prefix: str = ""):
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            del self._entries[key]
+        # 正在进行中的请求可能返回失效前的数据，标记后不写入缓存
+        for key in [k for k in self._inflight if k.startswith(prefix)]:
+            self._invalidated.add(self._inflight.pop(key))
+
+    def invalidate_for_write(self, endpoint: str):
+        label = endpoint_label(endpoint)
+        if label not in ("instance-action", "snatch-instance", "create-instance"):
+            return
+        alias = endpoint.rsplit("/", 1)[0]
+        self.invalidate(f"{alias}/")
+        if label != "instance-action":
+            self.invalidate("tasks/snatch/")
+
+panel_cache = PanelReadCache()
+
+Gauge("tgbot_panel_circuits_open", "Panel endpoints whose circuit breaker is currently open.", lambda: sum(1 for b in _breakers.values() if b.is_open))
+
+async def _panel_request(method: str, endpoint: str, **kwargs):
+    """
+    发送面板请求：熔断时直接失败，GET 请求在超时、连接错误或 5xx 时按带抖动的指数退避重试，
+    所有等待都不超过当前用户操作的剩余时限。
+    """
+    label = endpoint_label(endpoint)
+    breaker = get_breaker(endpoint)
+    attempts = PANEL_RETRY_ATTEMPTS if method == "GET" else 1
+    for attempt in range(attempts):
+        remaining = deadline_remaining()
+        if remaining is not None and remaining <= 0:
+            PANEL_REQUEST_ERRORS.inc(endpoint=label, method=method, reason="deadline")
+            return {"error": "操作超时，面板响应过慢，请稍后重试。"}
+        if not breaker.allow():
+            PANEL_REQUEST_ERRORS.inc(endpoint=label, method=method, reason="circuit_open")
+            return {"error": f"面板暂时不可用 (连续请求失败)，请约 {max(1, round(breaker.retry_after()))} 秒后重试。"}
+        result, retryable = await _panel_attempt(method, endpoint, label, breaker, remaining, **kwargs)
+        if not retryable or attempt == attempts - 1:
+            return result
+        delay = random.uniform(0, min(PANEL_RETRY_MAX_DELAY, PANEL_RETRY_BASE_DELAY * 2 ** attempt))
+        remaining = deadline_remaining()
+        if breaker.is_open or (remaining is not None and remaining <= delay):
+            return result
+        PANEL_REQUEST_RETRIES.inc(endpoint=label)
+        await asyncio.sleep(delay)
+    return result
+
+async def _panel_attempt(method: str, endpoint: str, label: str, breaker: CircuitBreaker, remaining: float | None, **kwargs):
+    """发送一次请求，返回 (结果, 是否值得重试)，并把结果计入熔断器。"""
+    client = get_panel_client()
+    started = time.perf_counter()
+    healthy = None
+    timeout = kwargs.pop("timeout", None) or get_endpoint_timeout(endpoint)
+    capped = remaining is not None and remaining < timeout.read
+    if capped:
+        timeout = httpx.Timeout(remaining, connect=min(timeout.connect, remaining))
+    try:
+        url = f"{BASE_URL}/{endpoint}"
+        response = await client.request(method, url, timeout=timeout, **kwargs)
+        response.raise_for_status()
+        healthy = True
+        if not response.content: return {}, False
+        return response.json(), False
+    except httpx.HTTPStatusError as e:
+        status = e.response.status_code
+        healthy = status < 500
+        PANEL_REQUEST_ERRORS.inc(endpoint=label, method=method, reason=str(status))
+        logger.error(f"API Error: {status} - {e.response.text}")
+        try: return {"error": e.response.json().get("error", "未知API错误"), "http_status": status}, not healthy
+        except: return {"error": f"API返回了非JSON错误: {status}", "http_status": status}, not healthy
+    except httpx.TimeoutException as e:
+        # 因用户操作时限被截短的超时不代表面板故障
+        healthy = None if capped else False
+        PANEL_REQUEST_ERRORS.inc(endpoint=label, method=method, reason="deadline" if capped else type(e).__name__)
+        logger.error(f"Request timed out: {endpoint}")
+        if capped: return {"error": "操作超时，面板响应过慢，请稍后重试。"}, False
+        return {"error": f"请求面板超时: {e}"}, True
+    except httpx.TransportError as e:
+        healthy = False
+        PANEL_REQUEST_ERRORS.inc(endpoint=label, method=method, reason=type(e).__name__)
+        logger.error(f"Request failed: {e}")
+        return {"error": str(e)}, True
+    except Exception as e:
+        PANEL_REQUEST_ERRORS.inc(endpoint=label, method=method, reason=type(e).__name__)
+        logger.error(f"Request failed: {e}")
+        return {"error": str(e)}, False
+    finally:
+        breaker.record(healthy)
+        PANEL_REQUEST_LATENCY.observe(time.perf_counter() - started, endpoint=label, method=method)
+
+async def api_request(method: str, endpoint: str, *, use_cache: bool = True, **kwargs):
+    """
+    请求面板 API。无额外参数的 GET 请求会经过读缓存，注意返回的缓存对象不可原地修改；
+    写操作完成后会使相关账户的缓存失效。
+    """
+    if method == "GET":
+        if use_cache and not kwargs:
+            prefetcher.note_request(endpoint)
+            return await panel_cache.get(endpoint, lambda: _panel_request(method, endpoint))
+        return await _panel_request(method, endpoint, **kwargs)
+    try:
+        return await _panel_request(method, endpoint, **kwargs)
+    finally:
+        panel_cache.invalidate_for_write(endpoint)
+
+# --- Telegram 发送队列 ---
+class InstrumentedHTTPXRequest(HTTPXRequest):
+    """在传输层记录 Bot API 请求的耗时和 429 响应，覆盖所有经由 Bot 对象发出的调用。"""
+    async def do_request(self, url: str, method: str, request_data=None, *args, **kwargs):
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            status, payload = await super().do_request(url, method, request_data, *args, **kwargs)
+        finally:
+            TELEGRAM_API_LATENCY.observe(time.perf_counter() - started, method=api_method)
+        if status == 429:
+            TELEGRAM_RATE_LIMITED.inc(method=api_method)
+        return status, payload
+
+PRIORITY_INTERACTIVE = 0          # 用户操作的即时反馈 (菜单编辑等)，优先发送
+PRIORITY_NOTIFY = 1               # 后台通知与临时消息
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def delay(self) -> float:
+        """返回距离下一个令牌可用还需等待的秒数，0 表示可以立即发送。"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+@dataclass
+class OutboundJob:
+    kind: str
+    chat_id: int
+    kwargs: dict
+    future: asyncio.Future
+    priority: int
+    message_id: int | None = None
+    attempts: int = 0
+
+class OutboundDispatcher:
+    """
+    所有发往 Telegram 的发送、编辑和删除操作都经过这个队列：
+    按全局和单个会话的令牌桶限速，处理 429 的 retry_after，用户操作优先于后台通知；
+    同一条消息尚未发出的多次编辑只会发送最后一次。
+    每个方法都返回一个 Future，调用方可以等待结果，也可以不等待。
+    """
+    def __init__(self):
+        self._lanes = (deque(), deque())
+        self._pending_edits: Dict[tuple, OutboundJob] = {}
+        self._global_bucket = TokenBucket(TG_GLOBAL_RATE, TG_GLOBAL_BURST)
+        self._chat_buckets: Dict[int, TokenBucket] = {}
+        self._busy_chats: set = set()
+        self._paused_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._runner: asyncio.Task | None = None
+        self._workers: set = set()
+        self._bot = None
+
+    def __len__(self):
+        return sum(len(lane) for lane in self._lanes)
+
+    def start(self, bot):
+        self._bot = bot
+        self._global_bucket = TokenBucket(TG_GLOBAL_RATE, TG_GLOBAL_BURST)
+        self._chat_buckets.clear()
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            try: await self._runner
+            except asyncio.CancelledError: pass
+            self._runner = None
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+
+    def send_message(self, chat_id: int, text: str, priority: int = PRIORITY_NOTIFY, **kwargs) -> asyncio.Future:
+        return self._submit("send", chat_id, dict(kwargs, text=text), priority)
+
+    def edit_message_text(self, chat_id: int, message_id: int, text: str, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> asyncio.Future:
+        key = (chat_id, message_id)
+        pending = self._pending_edits.get(key)
+        if pending is not None:
+            # 尚未发出的编辑直接被新的内容覆盖
+            pending.kwargs = dict(kwargs, text=text)
+            if priority < pending.priority:
+                self._lanes[pending.priority].remove(pending)
+                pending.priority = priority
+                self._lanes[priority].append(pending)
+            return pending.future
+        return self._submit("edit", chat_id, dict(kwargs, text=text), priority, message_id)
+
+    def delete_message(self, chat_id: int, message_id: int, priority: int = PRIORITY_NOTIFY) -> asyncio.Future:
+        return self._submit("delete", chat_id, {}, priority, message_id)
+
+    def delete_messages(self, chat_id: int, message_ids: List[int], priority: int = PRIORITY_NOTIFY) -> asyncio.Future:
+        return self._submit("delete_many", chat_id, {"message_ids": list(message_ids)}, priority)
+
+    def _submit(self, kind: str, chat_id: int, kwargs: dict, priority: int, message_id: int | None = None) -> asyncio.Future:
+        job = OutboundJob(kind, chat_id, kwargs, asyncio.get_running_loop().create_future(), priority, message_id)
+        job.future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        if self._bot is None or self._runner is None:
+            # 队列未启动时 (例如脚本中直接调用) 直接发送
+            return asyncio.ensure_future(self._call(job))
+        if kind == "edit":
+            self._pending_edits[(chat_id, message_id)] = job
+        self._lanes[priority].append(job)
+        self._wakeup.set()
+        return job.future
+
+    def _chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(TG_CHAT_RATE, TG_CHAT_BURST)
+            if len(self._chat_buckets) > 10000:
+                # 清理已回满的空闲会话桶
+                for cid in [c for c, b in self._chat_buckets.items() if c not in self._busy_chats and b.delay() == 0 and b.tokens >= b.capacity]:
+                    del self._chat_buckets[cid]
+                self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def _next_job(self):
+        """按优先级挑选第一个可以立即发送的任务，否则返回需要等待的时间。"""
+        min_wait = None
+        for lane in self._lanes:
+            for job in lane:
+                if job.chat_id in self._busy_chats:
+                    continue
+                wait = 0.0 if job.kind.startswith("delete") else self._chat_bucket(job.chat_id).delay()
+                if wait == 0.0:
+                    lane.remove(job)
+                    return job, 0.0
+                min_wait = wait if min_wait is None else min(min_wait, wait)
+        return None, min_wait
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+                continue
+            job, wait = self._next_job()
+            if job is None:
+                try: await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError: pass
+                continue
+            global_wait = self._global_bucket.delay()
+            if global_wait > 0:
+                self._lanes[job.priority].appendleft(job)
+                await asyncio.sleep(global_wait)
+                continue
+            self._global_bucket.take()
+            if not job.kind.startswith("delete"):
+                self._chat_bucket(job.chat_id).take()
+            if job.kind == "edit" and self._pending_edits.get((job.chat_id, job.message_id)) is job:
+                del self._pending_edits[(job.chat_id, job.message_id)]
+            # 同一会话同时只发送一条，保证消息顺序
+            self._busy_chats.add(job.chat_id)
+            worker = asyncio.create_task(self._execute(job))
+            self._workers.add(worker)
+            worker.add_done_callback(self._workers.discard)
+
+    async def _call(self, job: OutboundJob):
+        if job.kind == "send":
+            return await self._bot.send_message(chat_id=job.chat_id, **job.kwargs)
+        if job.kind == "edit":
+            return await self._bot.edit_message_text(chat_id=job.chat_id, message_id=job.message_id, **job.kwargs)
+        if job.kind == "delete_many":
+            return await self._bot.delete_messages(chat_id=job.chat_id, **job.kwargs)
+        return await self._bot.delete_message(chat_id=job.chat_id, message_id=job.message_id)
+
+    async def _execute(self, job: OutboundJob):
         try:
-            url = f"{BASE_URL}/{endpoint}"
-            response = await client.request(method, url, headers=HEADERS, timeout=30.0, **kwargs)
-            response.raise_for_status()
-            if not response.content: return {}
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            logger.error(f"API Error: {e.response.status_code} - {e.response.text}")
-            try: return {"error": e.response.json().get("error", "未知API错误")}
-            except: return {"error": f"API返回了非JSON错误: {e.response.status_code}"}
+            result = await self._call(job)
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else float(e.retry_after)
+            job.attempts += 1
+            logger.warning(f"Telegram 限流，{retry_after} 秒后重试 (会话 {job.chat_id})")
+            if job.attempts > TG_MAX_RETRIES:
+                if not job.future.done(): job.future.set_exception(e)
+            else:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+                self._lanes[job.priority].appendleft(job)
         except Exception as e:
-            logger.error(f"Request failed: {e}")
-            return {"error": str(e)}
+            if not job.future.done(): job.future.set_exception(e)
+        else:
+            if not job.future.done(): job.future.set_result(result)
+        finally:
+            self._busy_chats.discard(job.chat_id)
+            self._wakeup.set()
+
+outbound = OutboundDispatcher()
+
+def edit_query_message(query, text: str, **kwargs) -> asyncio.Future:
+    """
+    通过发送队列编辑回调按钮所在的消息；内联消息没有 chat_id，直接编辑。
+    "加载中" 一类的提示可以不等待结果，它会与随后的编辑合并。
+    """
+    if query.message is None:
+        future = asyncio.ensure_future(query.edit_message_text(text, **kwargs))
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return future
+    return outbound.edit_message_text(query.message.chat_id, query.message.message_id, text, **kwargs)
+
+# --- 临时消息删除调度 ---
+class DeletionScheduler:
+    """
+    统一调度临时消息的删除：所有待删除消息放在一个按到期时间排序的堆中，
+    由一个后台协程处理，到期的消息按会话合并为一次批量删除。
+    待删除记录同时保存在本地数据库中，机器人重启后会继续删除。
+    """
+    MAX_BATCH = 100               # Telegram deleteMessages 单次最多删除 100 条
+
+    def __init__(self):
+        self._heap: List[tuple] = []
+        self._wakeup = asyncio.Event()
+        self._runner: asyncio.Task | None = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    def start(self):
+        db = get_db()
+        db.execute("CREATE TABLE IF NOT EXISTS pending_deletions (chat_id INTEGER NOT NULL, message_id INTEGER NOT NULL, due_at REAL NOT NULL, PRIMARY KEY (chat_id, message_id))")
+        self._heap = [(due_at, chat_id, message_id) for chat_id, message_id, due_at in db.execute("SELECT chat_id, message_id, due_at FROM pending_deletions")]
+        heapq.heapify(self._heap)
+        if self._heap:
+            logger.info(f"恢复了 {len(self._heap)} 条待删除的临时消息。")
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            try: await self._runner
+            except asyncio.CancelledError: pass
+            self._runner = None
+
+    def schedule(self, chat_id: int, message_id: int, kind: str = "default"):
+        due_at = time.time() + EPHEMERAL_TTLS.get(kind, EPHEMERAL_TTLS["default"])
+        heapq.heappush(self._heap, (due_at, chat_id, message_id))
+        try:
+            get_db().execute("INSERT OR REPLACE INTO pending_deletions (chat_id, message_id, due_at) VALUES (?, ?, ?)", (chat_id, message_id, due_at))
+        except sqlite3.Error as e:
+            logger.warning(f"保存待删除消息时出错: {e}")
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            wait = self._heap[0][0] - time.time()
+            if wait > 0:
+                try: await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError: pass
+                continue
+            now = time.time()
+            due_by_chat: Dict[int, List[int]] = {}
+            while self._heap and self._heap[0][0] <= now:
+                _, chat_id, message_id = heapq.heappop(self._heap)
+                due_by_chat.setdefault(chat_id, []).append(message_id)
+            for chat_id, message_ids in due_by_chat.items():
+                for i in range(0, len(message_ids), self.MAX_BATCH):
+                    batch = message_ids[i:i + self.MAX_BATCH]
+                    future = outbound.delete_messages(chat_id, batch) if len(batch) > 1 else outbound.delete_message(chat_id, batch[0])
+                    future.add_done_callback(lambda f, c=chat_id, b=batch: self._on_deleted(f, c, b))
+
+    @staticmethod
+    def _on_deleted(future: asyncio.Future, chat_id: int, message_ids: List[int]):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"删除临时消息时出错: {future.exception()}")
+        try:
+            get_db().executemany("DELETE FROM pending_deletions WHERE chat_id = ? AND message_id = ?", [(chat_id, m) for m in message_ids])
+        except sqlite3.Error as e:
+            logger.warning(f"清理待删除消息记录时出错: {e}")
+
+deletion_scheduler = DeletionScheduler()
+
+Gauge("tgbot_outbound_queue_length", "Telegram calls waiting in the send queue.", lambda: len(outbound))
+Gauge("tgbot_pending_deletions", "Ephemeral messages waiting to be deleted.", lambda: len(deletion_scheduler))
 
 # --- Telegram 机器人逻辑  ---
 def authorized(func):
@@ -89,44 +1099,463 @@ def authorized(func):
         user_id = update.effective_user.id
         if user_id not in AUTHORIZED_USER_IDS:
             if update.callback_query: await update.callback_query.answer("🚫 您没有权限。", show_alert=True)
-            else: await update.message.reply_text("🚫 您没有权限操作此机器人。")
+            elif update.inline_query: await update.inline_query.answer([], cache_time=0, is_personal=True)
+            else: await outbound.send_message(update.effective_chat.id, "🚫 您没有权限操作此机器人。", priority=PRIORITY_INTERACTIVE)
             return
         return await func(update, context, *args, **kwargs)
     return wrapper
 
-async def send_and_delete_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str):
+async def send_and_delete_message(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str, kind: str = "default"):
+    """
+    发送一条临时消息，并按消息类型对应的时间 (EPHEMERAL_TTLS) 交给删除调度器自动删除。
+    """
     try:
-        sent_message = await context.bot.send_message(chat_id=chat_id, text=text, parse_mode=ParseMode.MARKDOWN)
-        await asyncio.sleep(5)
-        await context.bot.delete_message(chat_id=chat_id, message_id=sent_message.message_id)
+        sent_message = await outbound.send_message(chat_id, text, parse_mode=ParseMode.MARKDOWN)
+        deletion_scheduler.schedule(chat_id, sent_message.message_id, kind)
     except Exception as e:
         logger.warning(f"发送或删除临时消息时出错: {e}")
 
-async def poll_task_status(chat_id: int, context: ContextTypes.DEFAULT_TYPE, task_id: str, task_name: str):
-    max_retries, retries = 120, 0
-    while retries < max_retries:
-        await asyncio.sleep(5)
-        result = await api_request("GET", f"task-status/{task_id}")
-        if not result or not result.get("status"):
-            retries += 1
-            continue
-        status = result.get("status")
+# --- 任务状态调度器 ---
+class RateLimiter:
+    """
+    简单的全局速率限制器，保证相邻两次请求之间至少间隔 1/qps 秒。
+    """
+    def __init__(self, qps: float):
+        self.interval = 1.0 / qps if qps > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+@dataclass
+class TrackedTask:
+    task_id: str
+    chat_id: int
+    task_name: str
+    started_at: float
+    next_check: float
+    on_finish: Any = None
+    alias: str | None = None
+
+class TaskStatusScheduler:
+    """
+    统一跟踪所有已提交的任务。由一个后台协程按轮次合并查询到期的任务状态：
+    面板支持时使用批量接口，否则以受限的并发逐个查询。
+    """
+    def __init__(self):
+        self._tasks: Dict[str, TrackedTask] = {}
+        self._wakeup = asyncio.Event()
+        self._limiter = RateLimiter(TASK_STATUS_MAX_QPS)
+        self._batch_supported = PANEL_BATCH_STATUS_ENDPOINT is not None
+        self._push_active = False
+        self._early_results: OrderedDict[str, dict] = OrderedDict()
+        self._runner: asyncio.Task | None = None
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def start(self):
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            try: await self._runner
+            except asyncio.CancelledError: pass
+            self._runner = None
+
+    def track(self, chat_id: int, task_id: str, task_name: str, on_finish=None, alias: str | None = None):
+        """
+        跟踪一个任务。提供 on_finish(status, result) 回调时，由回调处理 success/failure/timeout，
+        不再单独发送通知。提供 alias 时，任务结束后会刷新该账户的实例列表缓存。
+        """
+        now = time.monotonic()
+        task = self._tasks[task_id] = TrackedTask(task_id, chat_id, task_name, now, now + self._interval_for(0), on_finish, alias)
+        early_result = self._early_results.pop(task_id, None)
+        if early_result is not None:
+            asyncio.create_task(self._handle_result(task, early_result, pushed=True))
+        self._wakeup.set()
+
+    def _interval_for(self, age: float) -> float:
+        interval = TASK_POLL_INTERVALS[-1][1]
+        for max_age, step in TASK_POLL_INTERVALS:
+            if max_age is None or age < max_age:
+                interval = step
+                break
+        # 事件流可用时结果会被即时推送，轮询只作为兜底
+        return max(interval, TASK_EVENTS_FALLBACK_POLL) if self._push_active else interval
+
+    def set_push_active(self, active: bool):
+        if active == self._push_active:
+            return
+        self._push_active = active
+        if not active:
+            # 推送中断，已跟踪的任务立即恢复正常的轮询节奏
+            now = time.monotonic()
+            for task in self._tasks.values():
+                task.next_check = min(task.next_check, now + self._interval_for(now - task.started_at))
+            self._wakeup.set()
+
+    async def handle_event(self, task_id: str, result: dict):
+        """处理事件流推送的任务状态，与轮询结果走同一套逻辑。"""
+        task = self._tasks.get(task_id)
+        if task is None:
+            # 事件可能先于 track() 到达，暂存终态结果
+            if result.get("status") in ("success", "failure"):
+                self._early_results[task_id] = result
+                while len(self._early_results) > TASK_STATUS_BATCH_SIZE:
+                    self._early_results.popitem(last=False)
+            return
+        await self._handle_result(task, result, pushed=True)
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._tasks:
+                await self._wakeup.wait()
+                continue
+            now = time.monotonic()
+            next_due = min(t.next_check for t in self._tasks.values())
+            if next_due > now:
+                try: await asyncio.wait_for(self._wakeup.wait(), timeout=next_due - now)
+                except asyncio.TimeoutError: pass
+                continue
+            due = [t for t in self._tasks.values() if t.next_check <= now]
+            try:
+                results = await self._fetch_statuses([t.task_id for t in due])
+            except Exception as e:
+                logger.error(f"查询任务状态时出错: {e}")
+                results = {}
+            for task in due:
+                await self._handle_result(task, results.get(task.task_id))
+
+    async def _fetch_statuses(self, task_ids: List[str]) -> Dict[str, dict]:
+        results: Dict[str, dict] = {}
+        if self._batch_supported:
+            for i in range(0, len(task_ids), TASK_STATUS_BATCH_SIZE):
+                chunk = task_ids[i:i + TASK_STATUS_BATCH_SIZE]
+                await self._limiter.acquire()
+                data = await api_request("POST", PANEL_BATCH_STATUS_ENDPOINT, json={"task_ids": chunk})
+                if not isinstance(data, (dict, list)) or (isinstance(data, dict) and "error" in data):
+                    if isinstance(data, dict) and data.get("http_status") in (404, 405):
+                        logger.info("面板不支持批量任务状态查询，改为逐个查询。")
+                        self._batch_supported = False
+                        break
+                    # 其他错误 (超时、5xx、熔断、鉴权等) 视为本次失败，本轮跳过，相关任务按原间隔稍后再查
+                    return results
+                items = data.items() if isinstance(data, dict) else ((item.get("task_id"), item) for item in data if isinstance(item, dict))
+                for task_id, item in items:
+                    if task_id is not None and isinstance(item, dict):
+                        results[str(task_id)] = item
+            else:
+                return results
+        semaphore = asyncio.Semaphore(TASK_STATUS_CONCURRENCY)
+        async def fetch_one(task_id: str):
+            async with semaphore:
+                await self._limiter.acquire()
+                results[task_id] = await api_request("GET", f"task-status/{task_id}")
+        await asyncio.gather(*(fetch_one(t) for t in task_ids if t not in results))
+        return results
+
+    async def _handle_result(self, task: TrackedTask, result: dict | None, pushed: bool = False):
+        if task.task_id not in self._tasks:
+            return
+        status = result.get("status") if isinstance(result, dict) else None
+        if status in ("success", "failure"):
+            del self._tasks[task.task_id]
+            self._finish(task, status, result.get('result'), pushed)
+            return
+        now = time.monotonic()
+        age = now - task.started_at
+        if age >= TASK_POLL_TIMEOUT:
+            del self._tasks[task.task_id]
+            self._finish(task, "timeout", None)
+            return
+        task.next_check = now + self._interval_for(age)
+
+    def _finish(self, task: TrackedTask, status: str, result, pushed: bool = False):
+        if task.alias and status != "timeout":
+            prefetcher.after_instance_action(task.alias)
+        if task.on_finish is not None:
+            try:
+                task.on_finish(status, result)
+            except Exception as e:
+                logger.error(f"处理任务 {task.task_id} 结果时出错: {e}")
+            return
         if status == "success":
-            logger.info(f"任务 {task_id} ({task_name}) 成功，由后端处理通知，机器人轮询结束。")
+            if not (pushed and TASK_NOTIFY_SUCCESS):
+                logger.info(f"任务 {task.task_id} ({task.task_name}) 成功，由后端处理通知，机器人轮询结束。")
+                return
+            final_message = f"🔔 *任务成功通知*\n\n*任务名称*: `{task.task_name}`\n\n*结果*:\n`{result}`"
+            self._notify(task.chat_id, final_message, parse_mode=ParseMode.MARKDOWN)
+        elif status == "failure":
+            final_message = f"🔔 *任务失败通知*\n\n*任务名称*: `{task.task_name}`\n\n*原因*:\n`{result}`"
+            self._notify(task.chat_id, final_message, parse_mode=ParseMode.MARKDOWN)
+        else:
+            self._notify(task.chat_id, f"🔔 *任务超时*\n\n任务 `{task.task_name}` 轮询超时（超过{TASK_POLL_TIMEOUT // 60}分钟），请在网页端查看最终结果。")
+
+    def _notify(self, chat_id: int, text: str, **kwargs):
+        # 只提交到发送队列而不等待发送完成，单个会话的限速不会拖住整个调度循环
+        outbound.send_message(chat_id, text, priority=PRIORITY_NOTIFY, **kwargs).add_done_callback(self._on_notify_done)
+
+    @staticmethod
+    def _on_notify_done(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"发送任务通知时出错: {future.exception()}")
+
+task_scheduler = TaskStatusScheduler()
+
+# --- 任务事件推送 ---
+TASK_EVENTS_RECEIVED = Counter("tgbot_task_events_total", "Task state events received from the panel event stream.", ("status",))
+
+class SSEParser:
+    """
+    逐行解析 Server-Sent Events。遇到空行时返回一个完整的事件 (事件类型, 数据)，
+    同时记录最近的事件 ID 和服务端建议的重连间隔 (秒)。
+    """
+    def __init__(self, last_event_id: str | None = None, retry: float | None = None):
+        self.last_event_id = last_event_id
+        self.retry = retry
+        self._event_type = "message"
+        self._data_lines: List[str] = []
+
+    def feed(self, line: str) -> tuple | None:
+        if not line:
+            event = (self._event_type, "\n".join(self._data_lines)) if self._data_lines else None
+            self._event_type, self._data_lines = "message", []
+            return event
+        if line.startswith(":"):
+            return None  # 心跳注释
+        field, _, value = line.partition(":")
+        if value.startswith(" "): value = value[1:]
+        if field == "data":
+            self._data_lines.append(value)
+        elif field == "event":
+            self._event_type = value
+        elif field == "id" and "\0" not in value:
+            self.last_event_id = value
+        elif field == "retry" and value.isdigit():
+            self.retry = int(value) / 1000
+        return None
+
+class TaskEventStream:
+    """
+    订阅面板的任务状态事件流 (SSE)。连接正常时任务结果被即时推送，轮询降为低频兜底；
+    断线后携带 Last-Event-ID 重连续传，面板不支持事件流时完全回退到轮询。
+    事件数据格式: {"task_id": "...", "status": "running|success|failure", "result": ...}
+    """
+    def __init__(self, scheduler: TaskStatusScheduler):
+        self._scheduler = scheduler
+        self.last_event_id: str | None = None
+        self.connected = False
+        self._retry_delay: float | None = None
+        self._runner: asyncio.Task | None = None
+
+    def start(self):
+        if TASK_EVENTS_ENDPOINT and (self._runner is None or self._runner.done()):
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            try: await self._runner
+            except asyncio.CancelledError: pass
+            self._runner = None
+        # 退出时调度器随后也会停止，不再唤醒它重新安排轮询
+        self.connected = False
+
+    def _set_connected(self, connected: bool):
+        self.connected = connected
+        self._scheduler.set_push_active(connected)
+
+    async def _run(self):
+        attempt = 0
+        while True:
+            try:
+                available, received = await self._consume()
+                if not available:
+                    delay = TASK_EVENTS_UNAVAILABLE_RETRY
+                else:
+                    if received: attempt = 0
+                    delay = self._retry_delay or TASK_EVENTS_RECONNECT_DELAYS[min(attempt, len(TASK_EVENTS_RECONNECT_DELAYS) - 1)]
+                    logger.info(f"任务事件流已断开，{delay} 秒后重连。")
+            except Exception as e:
+                delay = TASK_EVENTS_RECONNECT_DELAYS[min(attempt, len(TASK_EVENTS_RECONNECT_DELAYS) - 1)]
+                logger.warning(f"任务事件流连接失败: {e}，{delay} 秒后重连，期间使用轮询。")
+            self._set_connected(False)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def _consume(self):
+        """
+        读取一次事件流连接，返回 (面板是否提供事件流, 是否收到过数据)。
+        """
+        headers = {"Accept": "text/event-stream", "Cache-Control": "no-cache"}
+        if self.last_event_id is not None:
+            headers["Last-Event-ID"] = self.last_event_id
+        timeout = httpx.Timeout(PANEL_CONNECT_TIMEOUT, read=TASK_EVENTS_READ_TIMEOUT)
+        received = False
+        async with get_panel_client().stream("GET", f"{BASE_URL}/{TASK_EVENTS_ENDPOINT}", headers=headers, timeout=timeout) as response:
+            content_type = response.headers.get("content-type", "")
+            if response.status_code != 200 or not content_type.startswith("text/event-stream"):
+                logger.info(f"面板未提供任务事件流 (HTTP {response.status_code})，继续使用轮询。")
+                return False, False
+            logger.info("任务事件流已连接。")
+            self._set_connected(True)
+            parser = SSEParser(self.last_event_id, self._retry_delay)
+            async for line in response.aiter_lines():
+                received = True
+                event = parser.feed(line)
+                self.last_event_id, self._retry_delay = parser.last_event_id, parser.retry
+                if event is not None:
+                    await self._dispatch(*event)
+        return True, received
+
+    async def _dispatch(self, event_type: str, data: str):
+        if event_type not in ("message", "task"):
             return
-        if status == "failure":
-            final_message = f"🔔 *任务失败通知*\n\n*任务名称*: `{task_name}`\n\n*原因*:\n`{result.get('result')}`"
-            await context.bot.send_message(chat_id=chat_id, text=final_message, parse_mode=ParseMode.MARKDOWN)
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            logger.warning(f"无法解析任务事件: {data[:200]}")
+            return
+        if not isinstance(payload, dict) or payload.get("task_id") is None:
+            return
+        TASK_EVENTS_RECEIVED.inc(status=str(payload.get("status")))
+        await self._scheduler.handle_event(str(payload["task_id"]), payload)
+
+task_events = TaskEventStream(task_scheduler)
+
+Gauge("tgbot_tracked_tasks", "Panel tasks currently tracked by the task status scheduler (former poll_task_status pollers).", lambda: len(task_scheduler))
+Gauge("tgbot_task_events_connected", "Whether the panel task event stream is connected (1) or the bot is polling only (0).", lambda: int(task_events.connected))
+Gauge("tgbot_background_tasks", "asyncio tasks currently alive in the bot process.", lambda: len(asyncio.all_tasks()))
+
+# --- 回调数据路由 ---
+class CallbackCodec:
+    """
+    生成长度安全的 callback_data。过长、含有分隔符 ":" 或以 "~" 开头的参数会被替换为
+    "~<id>" 形式的短 ID，原值保存在本地数据库中，重启后旧按钮依然有效。
+    """
+    PREFIX = "~"
+
+    def __init__(self):
+        self._ids: Dict[str, str] | None = None
+        self._values: Dict[str, str] = {}
+
+    def _load(self):
+        if self._ids is not None:
             return
-        retries += 1
-    await context.bot.send_message(chat_id=chat_id, text=f"🔔 *任务超时*\n\n任务 `{task_name}` 轮询超时（超过10分钟），请在网页端查看最终结果。")
+        db = get_db()
+        db.execute("CREATE TABLE IF NOT EXISTS callback_values (id INTEGER PRIMARY KEY AUTOINCREMENT, value TEXT NOT NULL UNIQUE)")
+        self._ids = {}
+        for row_id, value in db.execute("SELECT id, value FROM callback_values"):
+            short_id = self.PREFIX + self._base36(row_id)
+            self._ids[value] = short_id
+            self._values[short_id] = value
+
+    @staticmethod
+    def _base36(number: int) -> str:
+        digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+        text = ""
+        while True:
+            number, remainder = divmod(number, 36)
+            text = digits[remainder] + text
+            if number == 0: return text
+
+    def intern(self, value: str) -> str:
+        self._load()
+        short_id = self._ids.get(value)
+        if short_id is None:
+            db = get_db()
+            db.execute("INSERT OR IGNORE INTO callback_values (value) VALUES (?)", (value,))
+            row_id = db.execute("SELECT id FROM callback_values WHERE value = ?", (value,)).fetchone()[0]
+            short_id = self.PREFIX + self._base36(row_id)
+            self._ids[value] = short_id
+            self._values[short_id] = value
+        return short_id
+
+    def encode(self, command: str, *args) -> str:
+        parts = [command]
+        for arg in args:
+            arg = str(arg)
+            if ":" in arg or arg.startswith(self.PREFIX) or len(arg.encode("utf-8")) > CALLBACK_INLINE_ARG_MAX:
+                arg = self.intern(arg)
+            parts.append(arg)
+        data = ":".join(parts)
+        if len(data.encode("utf-8")) > CALLBACK_DATA_LIMIT:
+            # 仍然超长时，把剩余的参数也全部替换为短 ID
+            data = ":".join([command] + [a if a.startswith(self.PREFIX) else self.intern(a) for a in parts[1:]])
+        if len(data.encode("utf-8")) > CALLBACK_DATA_LIMIT:
+            raise ValueError(f"callback_data 超过 {CALLBACK_DATA_LIMIT} 字节: {data}")
+        return data
+
+    def decode(self, arg: str) -> str:
+        if not arg.startswith(self.PREFIX):
+            return arg
+        self._load()
+        value = self._values.get(arg)
+        if value is None:
+            raise KeyError(f"未知的回调参数 ID: {arg}")
+        return value
+
+callback_codec = CallbackCodec()
+
+def cb(command: str, *args) -> str:
+    """生成按钮的 callback_data，例如 cb("account", alias)。"""
+    return callback_codec.encode(command, *args)
+
+class CallbackRouter:
+    """
+    按 callback_data 的第一段 (命令) 查表分发到注册的处理函数，并按声明的类型转换参数。
+    未提供的参数使用处理函数的默认值。
+    """
+    def __init__(self):
+        self._routes: Dict[str, tuple] = {}
+
+    def route(self, command: str, *arg_types):
+        def decorator(func):
+            self._routes[command] = (func, arg_types)
+            return func
+        return decorator
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE, data: str) -> bool:
+        command, *raw_args = data.split(":")
+        route = self._routes.get(command)
+        if route is None:
+            return False
+        func, arg_types = route
+        try:
+            args = [arg_type(callback_codec.decode(raw)) for arg_type, raw in zip(arg_types, raw_args)]
+        except (KeyError, ValueError) as e:
+            logger.warning(f"无法解析回调数据 {data}: {e}")
+            # 回调在分发前已经应答过，只能另发一条临时消息提示
+            asyncio.create_task(send_and_delete_message(context, update.effective_chat.id, "❌ 按钮已失效，请返回主菜单重试。", "error"))
+            return True
+        await func(update, context, *args)
+        return True
+
+callback_router = CallbackRouter()
 
 # --- 菜单构建函数 (已全部更新为使用新的页脚) ---
 async def build_param_selection_menu(form_data: dict, action_type: str, context: ContextTypes.DEFAULT_TYPE):
-    shape = form_data.get('shape')
+    return _build_param_selection_menu(
+        context.user_data.get('alias'), form_data.get('shape'), form_data.get('ocpus'), form_data.get('memory_in_gbs'),
+        form_data.get('boot_volume_size'), form_data.get('display_name_prefix', 'N/A'),
+        form_data.get('min_delay', '45'), form_data.get('max_delay', '90'),
+    )
+
+@functools.lru_cache(maxsize=MENU_CACHE_SIZE)
+def _build_param_selection_menu(alias, shape, ocpu_val, mem_val, disk_val, name, min_delay, max_delay):
     is_flex = shape and "Flex" in shape
     text = f"⚙️ *请配置实例参数*\n*抢占任务*\n\n"
-    text += f"实例名称: `{form_data.get('display_name_prefix', 'N/A')}`\n"
+    text += f"实例名称: `{name}`\n"
     spec_text = '尚未选择'
     if shape:
         if 'A1.Flex' in shape: spec_text = 'ARM'
@@ -136,18 +1565,16 @@ async def build_param_selection_menu(form_data: dict, action_type: str, context:
     all_params_selected = True
     keyboard.append([InlineKeyboardButton("─── 实例机型选择 ───", callback_data="ignore")])
     shape_options = {"VM.Standard.A1.Flex": "ARM","VM.Standard.E2.1.Micro": "AMD"}
-    shape_buttons = [InlineKeyboardButton(f"{'✅ ' if shape == k else ''}{v}", callback_data=f"form_param:shape:{k}") for k, v in shape_options.items()]
+    shape_buttons = [InlineKeyboardButton(f"{'✅ ' if shape == k else ''}{v}", callback_data=cb("form_param", "shape", k)) for k, v in shape_options.items()]
     keyboard.append(shape_buttons)
     if not shape: all_params_selected = False
     if is_flex:
-        ocpu_val = form_data.get('ocpus')
         text += f"OCPU: `{ocpu_val or '尚未选择'}`\n"
         keyboard.append([InlineKeyboardButton("─── 实例CPU规格 ───", callback_data="ignore")])
         options = {"1": "1 OCPU", "2": "2 OCPU", "3": "3 OCPU", "4": "4 OCPU"}
         option_buttons = [InlineKeyboardButton(f"{'✅ ' if str(ocpu_val) == k else ''}{v}", callback_data=f"form_param:ocpus:{k}") for k, v in options.items()]
         keyboard.append(option_buttons)
         if not ocpu_val: all_params_selected = False
-        mem_val = form_data.get('memory_in_gbs')
         text += f"内存: `{f'{mem_val} GB' if mem_val else '尚未选择'}`\n"
         keyboard.append([InlineKeyboardButton("─── 实例运行内存规格 ───", callback_data="ignore")])
         options = {"6": "6 GB", "12": "12 GB", "18": "18 GB", "24": "24 GB"}
@@ -155,7 +1582,6 @@ async def build_param_selection_menu(form_data: dict, action_type: str, context:
         keyboard.append(option_buttons)
         if not mem_val: all_params_selected = False
     if shape:
-        disk_val = form_data.get('boot_volume_size')
         text += f"磁盘大小: `{f'{disk_val} GB' if disk_val else '尚未选择'}`\n"
         keyboard.append([InlineKeyboardButton("─── 实例硬盘大小 ───", callback_data="ignore")])
         options = {"50": "50 GB", "100": "100 GB", "150": "150 GB", "200": "200 GB"}
@@ -164,40 +1590,106 @@ async def build_param_selection_menu(form_data: dict, action_type: str, context:
         if not disk_val: all_params_selected = False
     else:
         all_params_selected = False
-    text += f"\n重试间隔: `{form_data.get('min_delay', '45')}-{form_data.get('max_delay', '90')} 秒`"
+    text += f"\n重试间隔: `{min_delay}-{max_delay} 秒`"
     if all_params_selected:
         keyboard.append([InlineKeyboardButton("🚀 确认提交", callback_data="form_submit")])
-    alias = context.user_data.get('alias')
-    keyboard.append([InlineKeyboardButton("⬅️ 返回", callback_data=f"back:account:{alias}")])
+    keyboard.append([InlineKeyboardButton("⬅️ 返回", callback_data=cb("back", "account", alias))])
     keyboard.extend(get_footer_ruler(add_close_button=False))
     return text, InlineKeyboardMarkup(keyboard)
 
-async def build_main_menu():
-    profiles = await api_request("GET", "profiles")
+class ProfileIndex:
+    """
+    账户列表的预计算索引。面板返回的账户列表变化时才重新排序，并缓存各页的菜单；
+    提供前缀与子串查找，供分页选择器、内联查询和 /account 命令使用。
+    """
+    def __init__(self):
+        self._source: List[str] | None = None
+        self.aliases: List[str] = []      # 自然排序后的账户名
+        self._rank: Dict[str, int] = {}
+        self._lowered: List[tuple] = []   # (小写账户名, 账户名)，按字典序排列，用于前缀二分查找
+        self._pages: Dict[tuple, tuple] = {}
+
+    def __contains__(self, alias: str) -> bool:
+        return alias in self._rank
+
+    async def refresh(self):
+        """获取账户列表 (经过读缓存)，列表有变化时重建索引。返回面板的原始结果。"""
+        profiles = await api_request("GET", "profiles")
+        if isinstance(profiles, list) and profiles is not self._source:
+            if profiles != self._source:
+                self._rebuild(profiles)
+            self._source = profiles
+        return profiles
+
+    def _rebuild(self, profiles: List[str]):
+        self.aliases = sorted(profiles, key=natural_sort_key)
+        self._rank = {alias: i for i, alias in enumerate(self.aliases)}
+        self._lowered = sorted((alias.lower(), alias) for alias in self.aliases)
+        self._pages.clear()
+
+    def search(self, text: str, limit: int) -> List[str]:
+        """前缀匹配的账户排在前面，其余为包含该文本的账户，各自按自然顺序排列。"""
+        needle = text.strip().lower()
+        if not needle:
+            return self.aliases[:limit]
+        prefix = []
+        for lowered, alias in self._lowered[bisect.bisect_left(self._lowered, (needle,)):]:
+            if not lowered.startswith(needle): break
+            prefix.append(alias)
+        prefix.sort(key=self._rank.__getitem__)
+        matched = set(prefix)
+        substring = [alias for alias in self.aliases if alias not in matched and needle in alias.lower()]
+        return (prefix + substring)[:limit]
+
+    def page(self, page: int, inline_search: bool = False):
+        """返回 (菜单, 文本)，同一版本的账户列表下每页只构建一次。"""
+        total_pages = max(1, -(-len(self.aliases) // ACCOUNTS_PER_PAGE))
+        page = min(max(page, 1), total_pages)
+        cached = self._pages.get((page, inline_search))
+        if cached is None:
+            cached = self._pages[(page, inline_search)] = self._build_page(page, total_pages, inline_search)
+        return cached
+
+    def _build_page(self, page: int, total_pages: int, inline_search: bool):
+        keyboard = [
+            create_title_bar("Cloud Manager Panel Telegram Bot"),
+            [InlineKeyboardButton("📝 查看抢占实例任务", callback_data="tasks:running:1"), InlineKeyboardButton("🌐 账户总览", callback_data="fleet")],
+            [InlineKeyboardButton("👇 OCI 账户选择", callback_data="ignore")]
+        ]
+        aliases = self.aliases[(page - 1) * ACCOUNTS_PER_PAGE:page * ACCOUNTS_PER_PAGE]
+        for i in range(0, len(aliases), 2):
+            keyboard.append([InlineKeyboardButton(alias, callback_data=cb("account", alias)) for alias in aliases[i:i + 2]])
+        if total_pages > 1:
+            keyboard.append([
+                InlineKeyboardButton("⬅️ 上一页", callback_data=f"main:{page - 1}") if page > 1 else InlineKeyboardButton(" ", callback_data="ignore"),
+                InlineKeyboardButton(f"{page}/{total_pages}", callback_data="ignore"),
+                InlineKeyboardButton("下一页 ➡️", callback_data=f"main:{page + 1}") if page < total_pages else InlineKeyboardButton(" ", callback_data="ignore"),
+            ])
+        if inline_search:
+            keyboard.append([InlineKeyboardButton("🔍 搜索账户", switch_inline_query_current_chat="")])
+        keyboard.extend(get_footer_ruler(add_close_button=True)) # 只在主菜单显示关闭按钮
+        text = "请选择要操作的 OCI 账户:"
+        if total_pages > 1:
+            text += f" (共 {len(self.aliases)} 个，第 {page}/{total_pages} 页)"
+        return InlineKeyboardMarkup(keyboard), text
+
+profile_index = ProfileIndex()
+
+async def build_main_menu(page: int = 1, inline_search: bool = False):
+    profiles = await profile_index.refresh()
     if not profiles or "error" in profiles:
         return None, f"❌ 无法从面板获取账户列表: {profiles.get('error', '未知错误') if profiles else '无响应'}"
     if not profiles:
         return None, "面板中尚未配置任何OCI账户。"
-    profiles.sort(key=natural_sort_key)
-    keyboard = [
-        create_title_bar("Cloud Manager Panel Telegram Bot"),
-        [InlineKeyboardButton("📝 查看抢占实例任务", callback_data="tasks:running:1")],
-        [InlineKeyboardButton("👇 OCI 账户选择", callback_data="ignore")]
-    ]
-    for i in range(0, len(profiles), 2):
-        row = [InlineKeyboardButton(profiles[i], callback_data=f"account:{profiles[i]}")]
-        if i + 1 < len(profiles):
-            row.append(InlineKeyboardButton(profiles[i+1], callback_data=f"account:{profiles[i+1]}"))
-        keyboard.append(row)
-    keyboard.extend(get_footer_ruler(add_close_button=True)) # 只在主菜单显示关闭按钮
-    return InlineKeyboardMarkup(keyboard), "请选择要操作的 OCI 账户:"
+    return profile_index.page(page, inline_search)
 
 async def build_account_menu(alias: str, context: ContextTypes.DEFAULT_TYPE):
+    remember_account(context.user_data, alias)
     instances = await api_request("GET", f"{alias}/instances")
-    context.user_data['instance_list'] = instances
+    context.user_data['instance_list'] = [compact_instance(inst) for inst in instances] if isinstance(instances, list) else None
     keyboard = [
         create_title_bar(f"账户: {alias}"),
-        [InlineKeyboardButton("🤖 创建及抢占实例", callback_data=f"start_snatch:{alias}")],
+        [InlineKeyboardButton("🤖 创建及抢占实例", callback_data=cb("start_snatch", alias)), InlineKeyboardButton("☑️ 批量操作", callback_data="bulk:open")],
         [InlineKeyboardButton("👇 选择下方实例以执行操作 👇", callback_data="ignore")]
     ]
     if isinstance(instances, list) and instances:
@@ -218,22 +1710,52 @@ async def build_account_menu(alias: str, context: ContextTypes.DEFAULT_TYPE):
     keyboard.extend(get_footer_ruler(add_close_button=False))
     return InlineKeyboardMarkup(keyboard), f"已选择账户: *{alias}*\n请选择功能模块或下方的一个实例:"
 
-async def build_instance_action_menu(alias: str):
+@functools.lru_cache(maxsize=MENU_CACHE_SIZE)
+def build_instance_action_menu(alias: str):
     keyboard = [
         create_title_bar("实例操作"),
         [InlineKeyboardButton("✅ 开机", callback_data="perform_action:START"), InlineKeyboardButton("🛑 关机", callback_data="perform_action:STOP")],
         [InlineKeyboardButton("🔄 重启", callback_data="perform_action:RESTART"), InlineKeyboardButton("🗑️ 终止", callback_data="perform_action:TERMINATE")],
         [InlineKeyboardButton("🌐 更换IP", callback_data="perform_action:CHANGEIP"), InlineKeyboardButton("🌐 分配IPv6", callback_data="perform_action:ASSIGNIPV6")],
-        [InlineKeyboardButton("⬅️ 返回", callback_data=f"back:account:{alias}")],
+        [InlineKeyboardButton("⬅️ 返回", callback_data=cb("back", "account", alias))],
     ]
     keyboard.extend(get_footer_ruler(add_close_button=False))
     return InlineKeyboardMarkup(keyboard), "请选择要执行的操作："
 
-def build_pagination_keyboard(view: str, current_page: int, total_pages: int) -> List[List[InlineKeyboardButton]]:
-    keyboard = []
-    running_text = "🏃 运行中的任务"
-    completed_text = "✅ 已完成的任务"
-    keyboard.append([
+def build_bulk_action_menu(alias: str, instances: List[dict], selected: List[str]):
+    selected_set = set(selected)
+    keyboard = [
+        create_title_bar("批量操作"),
+        [InlineKeyboardButton("▶️ 全选运行中", callback_data="bulk:sel:RUNNING"), InlineKeyboardButton("⏹ 全选已停止", callback_data="bulk:sel:STOPPED")],
+        [InlineKeyboardButton("☑️ 全选", callback_data="bulk:sel:ALL"), InlineKeyboardButton("⬜ 清空", callback_data="bulk:sel:NONE")],
+    ]
+    for i in range(0, len(instances), 2):
+        row = []
+        for j in range(i, min(i + 2, len(instances))):
+            inst = instances[j]
+            mark = "☑️" if inst['id'] in selected_set else "⬜"
+            row.append(InlineKeyboardButton(f"{mark} {inst['display_name']} ({inst['lifecycle_state']})", callback_data=f"bulk:toggle:{j}"))
+        keyboard.append(row)
+    if not instances:
+        keyboard.append([InlineKeyboardButton("该账户下没有实例", callback_data="ignore")])
+    if selected_set:
+        keyboard.append([InlineKeyboardButton("─── 对选中的实例执行 ───", callback_data="ignore")])
+        keyboard.append([InlineKeyboardButton("✅ 开机", callback_data="bulk:do:START"), InlineKeyboardButton("🛑 关机", callback_data="bulk:do:STOP")])
+        keyboard.append([InlineKeyboardButton("🔄 重启", callback_data="bulk:do:RESTART"), InlineKeyboardButton("🗑️ 终止", callback_data="bulk:do:TERMINATE")])
+    keyboard.append([InlineKeyboardButton("⬅️ 返回", callback_data=cb("back", "account", alias))])
+    keyboard.extend(get_footer_ruler(add_close_button=False))
+    text = f"☑️ *批量操作* - 账户 *{alias}*\n已选择 {len(selected_set)}/{len(instances)} 个实例，请勾选实例后选择操作："
+    return InlineKeyboardMarkup(keyboard), text
+
+@functools.lru_cache(maxsize=MENU_CACHE_SIZE)
+def build_pagination_markup(view: str, current_page: int, total_pages: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(build_pagination_keyboard(view, current_page, total_pages))
+
+def build_pagination_keyboard(view: str, current_page: int, total_pages: int) -> List[List[InlineKeyboardButton]]:
+    keyboard = []
+    running_text = "🏃 运行中的任务"
+    completed_text = "✅ 已完成的任务"
+    keyboard.append([
         InlineKeyboardButton(running_text, callback_data="tasks:running:1"),
         InlineKeyboardButton(completed_text, callback_data="tasks:completed:1")
     ])
@@ -249,33 +1771,384 @@ def build_pagination_keyboard(view: str, current_page: int, total_pages: int) ->
         else:
             nav_row.append(InlineKeyboardButton("下一页 ➡️", callback_data="ignore"))
         keyboard.append(nav_row)
+    refresh_row = [InlineKeyboardButton("🔄 刷新", callback_data=f"tasks:{view}:{current_page}:refresh")]
+    if view == "running":
+        refresh_row.append(InlineKeyboardButton("📡 实时刷新", callback_data=f"live:running:{current_page}"))
+    keyboard.append(refresh_row)
     keyboard.append([InlineKeyboardButton("⬅️ 返回主菜单", callback_data=f"back:main")])
     keyboard.extend(get_footer_ruler(add_close_button=False))
     return keyboard
 
 # 在 bot.py 中
 
-async def show_all_tasks(query: Update.callback_query, view: str = 'running', page: int = 1):
-    await query.edit_message_text(text="*正在查询所有抢占任务...*", parse_mode=ParseMode.MARKDOWN)
+# --- 任务列表格式化 ---
+def format_task_specs(details: dict, compact: bool = False):
+    """
+    根据任务的 details 生成 (机型, 参数) 文本，E2.1.Micro 未填写的 OCPU/内存按 1 补全。
+    """
+    shape = details.get('shape', '')
+    shape_type = "ARM" if "A1" in shape else "AMD"
+    ocpus = details.get('ocpus')
+    memory_in_gbs = details.get('memory_in_gbs')
+    boot_volume_size = details.get('boot_volume_size', 50) # 使用数字50作为默认值
+    if 'E2.1.Micro' in shape:
+        ocpus = ocpus or 1
+        memory_in_gbs = memory_in_gbs or 1
+    if compact:
+        return shape_type, f"{ocpus}ocpu/{memory_in_gbs}GB/{boot_volume_size}GB"
+    return shape_type, f"{ocpus} Ocpu / {memory_in_gbs} GB / {boot_volume_size} GB"
+
+class TaskFormatter:
+    """
+    将任务渲染为 Markdown 片段，并按任务 ID 缓存渲染结果。缓存键包含任务中可能变化的字段
+    (状态、尝试次数、结果内容)，命中时只需重新计算运行时长。
+    """
+    def __init__(self, max_entries: int = TASK_RENDER_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._cache: OrderedDict = OrderedDict()
+
+    def render(self, task: dict, view: str) -> str:
+        task_id = (view, task.get('id') or f"{task.get('account_alias')}:{task.get('name')}")
+        result = task.get('result')
+        details = task.get('details')
+        version = (task.get('status'), task.get('attempt_count'), hash(result if isinstance(result, str) else repr(result)), hash(details if isinstance(details, str) else repr(details)))
+        cached = self._cache.get(task_id)
+        if cached is not None and cached[0] == version:
+            self._cache.move_to_end(task_id)
+        else:
+            cached = (version,) + (self._render_running(task) if view == 'running' else self._render_completed(task))
+            self._cache[task_id] = cached
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        _, head, start_time, tail = cached
+        if tail is None:
+            return head
+        return f"{head}{format_elapsed_time_tg(start_time)}{tail}"
+
+    @staticmethod
+    def _render_running(task: dict):
+        result_str = task.get('result', '')
+        try:
+            result_data = json.loads(result_str)
+            details = result_data.get('details', {})
+            shape_type, specs = format_task_specs(details)
+            attempt = f"【{result_data.get('attempt_count', 'N/A')}次】"
+            head = (f"🏃 *{task.get('name', 'N/A')}*\n"
+                    f"账号：{task.get('account_alias', 'N/A')}\n"
+                    f"机型：{shape_type}\n"
+                    f"参数：{specs}\n"
+                    f"用时：")
+            return head, result_data.get('start_time'), f"{attempt}\n\n"
+        except (json.JSONDecodeError, TypeError, AttributeError):
+            return f"_{task.get('account_alias', 'N/A')}: {task.get('name', 'N/A')} - {result_str or '获取状态中...'}\n\n_", None, None
+
+    @staticmethod
+    def _render_completed(task: dict):
+        status_icon = "✅" if task.get("status") == "success" else "❌"
+        original_result = task.get('result', '无结果')
+        full_result = '\n'.join(line for line in original_result.split('\n') if '可用区' not in line)
+        param_text = ""
+        # 这部分逻辑用于解析可能存在的旧任务格式中的 details
+        details_str = task.get('details')
+        details = {}
+        if details_str and isinstance(details_str, str):
+            try: details = json.loads(details_str)
+            except: pass
+        elif isinstance(details_str, dict):
+            details = details_str
+        if details:
+            try:
+                shape_type, specs = format_task_specs(details, compact=True)
+                param_text = f"机型：{shape_type}\n参数：{specs}\n"
+            except Exception as e:
+                logger.warning(f"无法格式化已完成任务的参数: {e}")
+        return f"{status_icon} *{task.get('name', 'N/A')}* (_{task.get('account_alias', 'N/A')}_)\n{param_text}{full_result}\n\n", None, None
+
+task_formatter = TaskFormatter()
+
+TASK_VIEW_ENDPOINTS = {"running": "tasks/snatch/running", "completed": "tasks/snatch/completed"}
+
+# --- 已完成任务归档 ---
+# 时间筛选: 键 -> (按钮文字, 时长秒数)
+TASK_ARCHIVE_PERIODS = {"all": ("全部时间", None), "24h": ("24小时", 86400), "7d": ("7天", 7 * 86400), "30d": ("30天", 30 * 86400)}
+TASK_ARCHIVE_STATUSES = {"all": "全部", "success": "✅ 成功", "failure": "❌ 失败"}
+
+def normalize_timestamp(value) -> str:
+    """将面板返回的时间统一为 UTC 的 "YYYY-MM-DDTHH:MM:SS"，便于按字符串排序和比较。"""
+    if not value:
+        return ""
+    text = str(value).strip()
     try:
-        running_tasks, completed_tasks = await asyncio.gather(
-            api_request("GET", "tasks/snatch/running"),
-            api_request("GET", "tasks/snatch/completed")
-        )
-    except Exception as e:
-        logger.error(f"获取任务列表时API请求失败: {e}")
+        dt = datetime.fromisoformat(text.replace("Z", "+00:00"))
+    except ValueError:
+        return text
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.strftime("%Y-%m-%dT%H:%M:%S")
+
+def task_attempts(task: dict) -> int | None:
+    """从任务或其 details/result 中取出尝试次数，没有时返回 None。"""
+    for source in (task, task.get('details'), task.get('result')):
+        if isinstance(source, str):
+            try: source = json.loads(source)
+            except ValueError: continue
+        if isinstance(source, dict) and source.get('attempt_count') is not None:
+            try: return int(source['attempt_count'])
+            except (TypeError, ValueError): return None
+    return None
+
+class TaskArchive:
+    """
+    已完成任务的本地归档。每次只向面板请求比本地最新记录更新的任务，
+    浏览、筛选和统计都只查询本地数据库。
+    """
+    def __init__(self):
+        self._schema_ready = False
+        self._synced_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _ensure_schema(self):
+        if self._schema_ready:
+            return
+        db = get_db()
+        db.execute("CREATE TABLE IF NOT EXISTS task_archive (task_id TEXT PRIMARY KEY, seq INTEGER NOT NULL, account_alias TEXT, status TEXT, completed_at TEXT, attempts INTEGER, data TEXT NOT NULL)")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_task_archive_completed ON task_archive (completed_at, seq)")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_task_archive_alias ON task_archive (account_alias, completed_at)")
+        db.execute("CREATE INDEX IF NOT EXISTS idx_task_archive_status ON task_archive (status, completed_at)")
+        self._schema_ready = True
+
+    def __len__(self):
+        return self.count()
+
+    def _cursor(self):
+        row = get_db().execute("SELECT task_id, completed_at FROM task_archive ORDER BY completed_at DESC, seq DESC LIMIT 1").fetchone()
+        return row if row else None
+
+    async def sync(self, force: bool = False) -> str | None:
+        """增量同步面板中新完成的任务，返回错误信息，成功时返回 None。"""
+        async with self._lock:
+            if not force and time.monotonic() - self._synced_at < TASK_ARCHIVE_SYNC_INTERVAL:
+                return None
+            self._ensure_schema()
+            endpoint = TASK_VIEW_ENDPOINTS["completed"]
+            cursor = self._cursor()
+            if cursor is None:
+                tasks = await api_request("GET", endpoint)
+            else:
+                tasks = await api_request("GET", endpoint, params=dict(zip(TASK_ARCHIVE_SINCE_PARAMS, cursor)))
+            if not isinstance(tasks, list):
+                return tasks.get('error', '未知错误') if isinstance(tasks, dict) and tasks else '无响应'
+            try:
+                self._store(tasks)
+            except sqlite3.Error as e:
+                logger.error(f"归档已完成任务时出错: {e}")
+                if get_db().in_transaction: get_db().execute("ROLLBACK")
+                return str(e)
+            self._synced_at = time.monotonic()
+            return None
+
+    def _store(self, tasks: List[dict]):
+        db = get_db()
+        seq = (db.execute("SELECT MAX(seq) FROM task_archive").fetchone()[0] or 0) + 1
+        rows = []
+        # 面板按从新到旧返回，倒序写入使 seq 随完成顺序递增
+        for task in reversed(tasks):
+            if not isinstance(task, dict): continue
+            completed_at = normalize_timestamp(task.get('completed_at'))
+            task_id = str(task.get('id') or f"{task.get('account_alias')}:{task.get('name')}:{completed_at}")
+            rows.append((task_id, seq, task.get('account_alias'), task.get('status'), completed_at, task_attempts(task), json.dumps(task, ensure_ascii=False)))
+            seq += 1
+        db.execute("BEGIN")
+        db.executemany("INSERT OR IGNORE INTO task_archive (task_id, seq, account_alias, status, completed_at, attempts, data) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        db.execute("COMMIT")
+
+    @staticmethod
+    def _where(alias: str | None, status: str | None, period: str | None):
+        clauses, args = [], []
+        if alias:
+            clauses.append("account_alias = ?"); args.append(alias)
+        if status:
+            clauses.append("status = ?"); args.append(status)
+        seconds = TASK_ARCHIVE_PERIODS.get(period or "all", (None, None))[1]
+        if seconds:
+            clauses.append("completed_at >= ?")
+            args.append(datetime.fromtimestamp(time.time() - seconds, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S"))
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+    def count(self, alias: str | None = None, status: str | None = None, period: str | None = None) -> int:
+        self._ensure_schema()
+        where, args = self._where(alias, status, period)
+        return get_db().execute(f"SELECT COUNT(*) FROM task_archive{where}", args).fetchone()[0]
+
+    def query(self, alias: str | None = None, status: str | None = None, period: str | None = None, offset: int = 0, limit: int = TASKS_PER_PAGE) -> List[dict]:
+        """按完成时间从新到旧返回符合条件的任务。"""
+        self._ensure_schema()
+        where, args = self._where(alias, status, period)
+        rows = get_db().execute(f"SELECT data FROM task_archive{where} ORDER BY completed_at DESC, seq DESC LIMIT ? OFFSET ?", args + [limit, offset]).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def stats(self, alias: str | None = None, period: str | None = None, limit: int = TASK_STATS_MAX_ACCOUNTS):
+        """按账户统计: [(账户, 任务数, 成功数, 平均尝试次数)]，按任务数从多到少排列。"""
+        self._ensure_schema()
+        where, args = self._where(alias, None, period)
+        return get_db().execute(
+            f"SELECT account_alias, COUNT(*), SUM(status = 'success'), AVG(attempts) FROM task_archive{where} "
+            f"GROUP BY account_alias ORDER BY COUNT(*) DESC, account_alias LIMIT ?", args + [limit]).fetchall()
+
+task_archive = TaskArchive()
+
+@functools.lru_cache(maxsize=MENU_CACHE_SIZE)
+def build_archive_markup(current_page: int, total_pages: int, status: str, period: str, alias: str | None, current_alias: str | None) -> InlineKeyboardMarkup:
+    keyboard = build_pagination_keyboard("completed", current_page, total_pages)
+    filter_rows = [
+        [InlineKeyboardButton(f"· {v} ·" if status == k else v, callback_data=f"tf:status:{k}") for k, v in TASK_ARCHIVE_STATUSES.items()],
+        [InlineKeyboardButton(f"· {v[0]} ·" if period == k else v[0], callback_data=f"tf:range:{k}") for k, v in TASK_ARCHIVE_PERIODS.items()],
+    ]
+    account_row = []
+    if alias:
+        account_row.append(InlineKeyboardButton(f"👤 {alias} ✖️", callback_data="tf:alias:all"))
+    elif current_alias:
+        account_row.append(InlineKeyboardButton(f"👤 仅看 {current_alias}", callback_data=cb("tf", "alias", current_alias)))
+    account_row.append(InlineKeyboardButton("📊 统计", callback_data="tasks:stats:1"))
+    filter_rows.append(account_row)
+    keyboard[1:1] = filter_rows
+    return InlineKeyboardMarkup(keyboard)
+
+def describe_task_filter(task_filter: dict) -> str:
+    parts = []
+    if task_filter.get('status'): parts.append(TASK_ARCHIVE_STATUSES[task_filter['status']])
+    if task_filter.get('range'): parts.append(TASK_ARCHIVE_PERIODS[task_filter['range']][0])
+    if task_filter.get('alias'): parts.append(f"账户 `{task_filter['alias']}`")
+    return f"筛选：{' · '.join(parts)}\n\n" if parts else ""
+
+async def show_archived_tasks(query, context: ContextTypes.DEFAULT_TYPE, page: int = 1, refresh: bool = False):
+    task_filter = context.user_data.get('task_filter') or {}
+    if refresh:
+        edit_query_message(query, "*正在同步已完成的任务...*", parse_mode=ParseMode.MARKDOWN)
+    error = await task_archive.sync(force=refresh)
+    if error and not len(task_archive):
+        logger.error(f"同步已完成任务时API请求失败: {error}")
         keyboard = [[InlineKeyboardButton("⬅️ 返回主菜单", callback_data="back:main")]]
         keyboard.extend(get_footer_ruler(add_close_button=False))
-        await query.edit_message_text(f"❌ 获取任务列表失败: {e}", reply_markup=InlineKeyboardMarkup(keyboard))
+        await edit_query_message(query, f"❌ 获取任务列表失败: {error}", reply_markup=InlineKeyboardMarkup(keyboard))
         return
-    source_list, title = [], ""
-    if view == 'running':
-        source_list = running_tasks if isinstance(running_tasks, list) else []
-        source_list.reverse()
-        title = ""
-    elif view == 'completed':
-        source_list = completed_tasks if isinstance(completed_tasks, list) else []
-        title = ""
+    status, period, alias = task_filter.get('status'), task_filter.get('range'), task_filter.get('alias')
+    total_items = task_archive.count(alias, status, period)
+    total_pages = (total_items + TASKS_PER_PAGE - 1) // TASKS_PER_PAGE if total_items > 0 else 1
+    page = max(1, min(page, total_pages))
+    tasks_on_page = task_archive.query(alias, status, period, offset=(page - 1) * TASKS_PER_PAGE)
+    text = f"❖ *任务详情* ❖  (第 {page}/{total_pages} 页)\n\n"
+    text += describe_task_filter(task_filter)
+    if error:
+        text += "_⚠️ 同步失败，以下为本地记录。_\n\n"
+    if not tasks_on_page:
+        text += "_当前分类下没有任务记录。_\n\n"
+    else:
+        for task in tasks_on_page:
+            text += task_formatter.render(task, 'completed')
+    reply_markup = build_archive_markup(page, total_pages, status or "all", period or "all", alias, context.user_data.get('current_alias'))
+    try:
+        await edit_query_message(query, text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
+    except BadRequest as e:
+        if "Message is not modified" not in str(e):
+            logger.error(f"编辑任务消息时出错: {e}")
+            await query.answer("❌ 更新消息时出错，请重试。", show_alert=True)
+    prefetcher.after_task_page('completed', page, task_filter=task_filter)
+
+async def show_task_stats(query, context: ContextTypes.DEFAULT_TYPE):
+    task_filter = context.user_data.get('task_filter') or {}
+    error = await task_archive.sync()
+    rows = task_archive.stats(task_filter.get('alias'), task_filter.get('range'))
+    period_text = TASK_ARCHIVE_PERIODS[task_filter.get('range') or "all"][0]
+    text = f"❖ *任务统计* ❖  ({period_text})\n\n"
+    if error:
+        text += "_⚠️ 同步失败，以下为本地记录。_\n\n"
+    if not rows:
+        text += "_当前分类下没有任务记录。_\n"
+    else:
+        total = sum(row[1] for row in rows)
+        succeeded = sum(row[2] or 0 for row in rows)
+        text += f"共 {total} 个任务，成功率 {succeeded * 100 // total}%\n\n"
+        for alias, count, success, avg_attempts in rows:
+            attempts_text = f" · 平均 {avg_attempts:.0f} 次" if avg_attempts is not None else ""
+            text += f"`{alias}`  {count} 个 · 成功 {(success or 0) * 100 // count}%{attempts_text}\n"
+    keyboard = [
+        [InlineKeyboardButton("✅ 已完成的任务", callback_data="tasks:completed:1"), InlineKeyboardButton("⬅️ 返回主菜单", callback_data="back:main")],
+    ]
+    keyboard.extend(get_footer_ruler(add_close_button=False))
+    try:
+        await edit_query_message(query, text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode=ParseMode.MARKDOWN)
+    except BadRequest as e:
+        if "Message is not modified" not in str(e): raise e
+
+class TaskSnapshotStore:
+    """
+    按用户和视图保存任务列表快照。快照放在模块级别，context.user_data 中只记录快照令牌，
+    避免会话持久化时复制整个任务列表；过期或超出容量 (LRU) 的快照会被淘汰。
+    """
+    def __init__(self, max_entries: int = TASK_SNAPSHOT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, tuple] = OrderedDict()  # (user_id, view) -> (令牌, 获取时间, 任务列表)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_data: dict, user_id: int, view: str) -> List[dict] | None:
+        key = (user_id, view)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        token, fetched_at, items = entry
+        if time.monotonic() - fetched_at >= TASK_SNAPSHOT_TTL:
+            del self._entries[key]
+            return None
+        # 会话被重置后令牌随之丢失，旧快照不再使用
+        if user_data.get('task_snapshots', {}).get(view) != token:
+            return None
+        self._entries.move_to_end(key)
+        return items
+
+    def put(self, user_data: dict, user_id: int, view: str, items: List[dict]):
+        token = secrets.token_hex(4)
+        self._entries[(user_id, view)] = (token, time.monotonic(), items)
+        self._entries.move_to_end((user_id, view))
+        user_data.setdefault('task_snapshots', {})[view] = token
+        now = time.monotonic()
+        for key in [k for k, entry in self._entries.items() if now - entry[1] >= TASK_SNAPSHOT_TTL]:
+            del self._entries[key]
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def discard(self, user_data: dict, user_id: int, view: str):
+        self._entries.pop((user_id, view), None)
+        user_data.get('task_snapshots', {}).pop(view, None)
+
+task_snapshots = TaskSnapshotStore()
+
+Gauge("tgbot_task_snapshots", "Task list snapshots held for paging.", lambda: len(task_snapshots))
+
+async def get_task_snapshot(context: ContextTypes.DEFAULT_TYPE, user_id: int, view: str, refresh: bool = False):
+    """
+    返回某个视图的任务列表快照 (已按显示顺序排列)。快照按用户和视图保存，
+    有效期内翻页直接使用快照，不再重新下载整个列表。获取失败时返回 None 和错误信息。
+    """
+    if refresh:
+        task_snapshots.discard(context.user_data, user_id, view)
+        panel_cache.invalidate(TASK_VIEW_ENDPOINTS[view])
+    else:
+        items = task_snapshots.get(context.user_data, user_id, view)
+        if items is not None:
+            return items, None
+    tasks = await api_request("GET", TASK_VIEW_ENDPOINTS[view])
+    if not isinstance(tasks, list):
+        error = tasks.get('error', '未知错误') if isinstance(tasks, dict) and tasks else '无响应'
+        return None, error
+    items = list(reversed(tasks)) if view == 'running' else tasks
+    task_snapshots.put(context.user_data, user_id, view, items)
+    return items, None
+
+def render_task_page(source_list: List[dict], view: str, page: int, title: str = ""):
+    """渲染任务列表的某一页，返回 (文本, 实际页码, 总页数)。"""
     total_items = len(source_list)
     total_pages = (total_items + TASKS_PER_PAGE - 1) // TASKS_PER_PAGE if total_items > 0 else 1
     page = max(1, min(page, total_pages))
@@ -288,223 +2161,728 @@ async def show_all_tasks(query: Update.callback_query, view: str = 'running', pa
         text += "_当前分类下没有任务记录。_\n\n"
     else:
         for task in tasks_on_page:
-            if view == 'running':
-                result_str = task.get('result', '')
-                try:
-                    result_data = json.loads(result_str)
-                    details = result_data.get('details', {})
-                    # --- ✅ 修复 #1: 将 'alias' 修改为 'account_alias' ---
-                    alias = f"账号：{task.get('account_alias', 'N/A')}"
-                    shape = details.get('shape', '')
-                    shape_type = "ARM" if "A1" in shape else "AMD"
-                    
-                    # --- ✨ 新增的修正逻辑 开始 ✨ ---
-                    ocpus = details.get('ocpus')
-                    memory_in_gbs = details.get('memory_in_gbs')
-                    boot_volume_size = details.get('boot_volume_size', 50) # 使用数字50作为默认值
-                    
-                    if 'E2.1.Micro' in shape:
-                        ocpus = ocpus or 1
-                        memory_in_gbs = memory_in_gbs or 1
-                    # --- ✨ 新增的修正逻辑 结束 ✨ ---
-
-                    specs = f"{ocpus} Ocpu / {memory_in_gbs} GB / {boot_volume_size} GB"
-                    elapsed_time = format_elapsed_time_tg(result_data.get('start_time'))
-                    attempt = f"【{result_data.get('attempt_count', 'N/A')}次】"
-                    text += (f"🏃 *{task.get('name', 'N/A')}*\n"
-                             f"{alias}\n"
-                             f"机型：{shape_type}\n"
-                             f"参数：{specs}\n"
-                             f"用时：{elapsed_time}{attempt}\n\n")
-                except (json.JSONDecodeError, TypeError):
-                    text += f"_{task.get('account_alias', 'N/A')}: {task.get('name', 'N/A')} - {result_str or '获取状态中...'}\n\n_"
-            elif view == 'completed':
-                status_icon = "✅" if task.get("status") == "success" else "❌"
-                # --- ✅ 修复 #1 (同样应用于此): 将 'alias' 修改为 'account_alias' ---
-                task_alias = task.get('account_alias', 'N/A')
-                task_name = task.get('name', 'N/A')
-                
-                original_result = task.get('result', '无结果')
-                lines = original_result.split('\n')
-                filtered_lines = [line for line in lines if '可用区' not in line]
-                full_result = '\n'.join(filtered_lines)
-
-                param_text = ""
-                # 这部分逻辑用于解析可能存在的旧任务格式中的 details
-                details_str = task.get('details') 
-                details = {}
-                if details_str and isinstance(details_str, str):
-                    try: details = json.loads(details_str)
-                    except: pass
-                elif isinstance(details_str, dict):
-                    details = details_str
-
-                if details:
-                    try:
-                        shape = details.get('shape', '')
-                        shape_type = "ARM" if "A1" in shape else "AMD"
-                        
-                        # --- ✨ 新增的修正逻辑 开始 ✨ ---
-                        ocpus = details.get('ocpus')
-                        memory_in_gbs = details.get('memory_in_gbs')
-                        boot_volume_size = details.get('boot_volume_size', 50)
-
-                        if 'E2.1.Micro' in shape:
-                            ocpus = ocpus or 1
-                            memory_in_gbs = memory_in_gbs or 1
-                        # --- ✨ 新增的修正逻辑 结束 ✨ ---
-
-                        specs = f"{ocpus}ocpu/{memory_in_gbs}GB/{boot_volume_size}GB"
-                        param_text = f"机型：{shape_type}\n参数：{specs}\n"
-                    except Exception as e:
-                        logger.warning(f"无法格式化已完成任务的参数: {e}")
-                        param_text = ""
-                text += f"{status_icon} *{task_name}* (_{task_alias}_)\n{param_text}{full_result}\n\n"
-    reply_markup = InlineKeyboardMarkup(build_pagination_keyboard(view, page, total_pages))
+            text += task_formatter.render(task, view)
+    return text, page, total_pages
+
+async def show_all_tasks(query: Update.callback_query, context: ContextTypes.DEFAULT_TYPE, view: str = 'running', page: int = 1, refresh: bool = False):
+    if view not in TASK_VIEW_ENDPOINTS: view = 'running'
+    if view == 'completed' and TASK_ARCHIVE:
+        await show_archived_tasks(query, context, page, refresh)
+        return
+    user_id = query.from_user.id
+    if refresh or task_snapshots.get(context.user_data, user_id, view) is None:
+        edit_query_message(query, "*正在查询所有抢占任务...*", parse_mode=ParseMode.MARKDOWN)
+    source_list, error = await get_task_snapshot(context, user_id, view, refresh)
+    if source_list is None:
+        logger.error(f"获取任务列表时API请求失败: {error}")
+        keyboard = [[InlineKeyboardButton("⬅️ 返回主菜单", callback_data="back:main")]]
+        keyboard.extend(get_footer_ruler(add_close_button=False))
+        await edit_query_message(query, f"❌ 获取任务列表失败: {error}", reply_markup=InlineKeyboardMarkup(keyboard))
+        return
+    text, page, total_pages = render_task_page(source_list, view, page)
+    reply_markup = build_pagination_markup(view, page, total_pages)
     try:
-        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
+        await edit_query_message(query, text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
     except BadRequest as e:
         if "Message is not modified" not in str(e):
             logger.error(f"编辑任务消息时出错: {e}")
             await query.answer("❌ 更新消息时出错，请重试。", show_alert=True)
+    prefetcher.after_task_page(view, page, items=source_list)
             
+# --- 实时任务面板 ---
+LIVE_EDITS = Counter("tgbot_live_dashboard_renders_total", "Live dashboard renders, by whether an edit was sent or suppressed as unchanged.", ("result",))
+
+@functools.lru_cache(maxsize=MENU_CACHE_SIZE)
+def build_live_markup(view: str, current_page: int, total_pages: int) -> InlineKeyboardMarkup:
+    keyboard = []
+    if total_pages > 1:
+        keyboard.append([
+            InlineKeyboardButton("⬅️ 上一页", callback_data=f"live:{view}:{current_page - 1}" if current_page > 1 else "ignore"),
+            InlineKeyboardButton(f"• {current_page}/{total_pages} •", callback_data="ignore"),
+            InlineKeyboardButton("下一页 ➡️", callback_data=f"live:{view}:{current_page + 1}" if current_page < total_pages else "ignore"),
+        ])
+    keyboard.append([InlineKeyboardButton("⏹ 停止实时刷新", callback_data=f"tasks:{view}:{current_page}")])
+    keyboard.append([InlineKeyboardButton("⬅️ 返回主菜单", callback_data="back:main")])
+    keyboard.extend(get_footer_ruler(add_close_button=False))
+    return InlineKeyboardMarkup(keyboard)
+
+@dataclass
+class LiveDashboard:
+    chat_id: int
+    message_id: int
+    view: str
+    page: int
+    last_active: float
+    digest: bytes | None = None
+
+class LiveDashboardManager:
+    """
+    每个会话最多一个实时任务面板。后台协程按 LIVE_REFRESH_INTERVAL 为每个视图查询一次面板，
+    再为各会话渲染；渲染结果 (文本与按钮) 的哈希未变化时不发送编辑。
+    会话内长时间没有操作、消息被删除或用户切换到其他菜单时停止刷新。
+    """
+    def __init__(self):
+        self._dashboards: Dict[int, LiveDashboard] = {}
+        self._wakeup = asyncio.Event()
+        self._runner: asyncio.Task | None = None
+
+    def __len__(self):
+        return len(self._dashboards)
+
+    def start(self):
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            try: await self._runner
+            except asyncio.CancelledError: pass
+            self._runner = None
+
+    async def watch(self, chat_id: int, message_id: int, view: str, page: int):
+        """在指定消息上开启 (或翻页) 实时面板，并立即渲染一次。"""
+        dashboard = LiveDashboard(chat_id, message_id, view, page, time.monotonic())
+        self._dashboards[chat_id] = dashboard
+        tasks = await api_request("GET", TASK_VIEW_ENDPOINTS[view])
+        if isinstance(tasks, list):
+            await self._render(dashboard, tasks, priority=PRIORITY_INTERACTIVE)
+        self._wakeup.set()
+
+    def on_callback(self, chat_id: int, message_id: int | None, command: str):
+        """会话中的任何按钮操作都视为活跃；在面板消息上点了其他菜单则停止刷新。"""
+        dashboard = self._dashboards.get(chat_id)
+        if dashboard is None:
+            return
+        dashboard.last_active = time.monotonic()
+        if message_id == dashboard.message_id and command != "live":
+            del self._dashboards[chat_id]
+
+    async def _run(self):
+        while True:
+            if not self._dashboards:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                # watch() 已经渲染过一次，下一轮按间隔刷新
+                await asyncio.sleep(LIVE_REFRESH_INTERVAL)
+                continue
+            now = time.monotonic()
+            for dashboard in [d for d in self._dashboards.values() if now - d.last_active >= LIVE_IDLE_TIMEOUT]:
+                self._pause(dashboard)
+            views = {d.view for d in self._dashboards.values()}
+            for view in views:
+                tasks = await api_request("GET", TASK_VIEW_ENDPOINTS[view], use_cache=False)
+                if not isinstance(tasks, list):
+                    logger.warning(f"实时面板获取任务列表失败: {tasks.get('error') if isinstance(tasks, dict) else tasks}")
+                    continue
+                for dashboard in [d for d in self._dashboards.values() if d.view == view]:
+                    await self._render(dashboard, tasks)
+            await asyncio.sleep(LIVE_REFRESH_INTERVAL)
+
+    async def _render(self, dashboard: LiveDashboard, tasks: List[dict], priority: int = PRIORITY_NOTIFY):
+        items = list(reversed(tasks)) if dashboard.view == 'running' else tasks
+        text, dashboard.page, total_pages = render_task_page(items, dashboard.view, dashboard.page, f"📡 _实时刷新中，每 {LIVE_REFRESH_INTERVAL} 秒更新_\n\n")
+        reply_markup = build_live_markup(dashboard.view, dashboard.page, total_pages)
+        digest = hashlib.blake2b((text + reply_markup.to_json()).encode("utf-8"), digest_size=16).digest()
+        if digest == dashboard.digest:
+            LIVE_EDITS.inc(result="suppressed")
+            return
+        dashboard.digest = digest
+        LIVE_EDITS.inc(result="sent")
+        future = outbound.edit_message_text(dashboard.chat_id, dashboard.message_id, text, priority=priority, reply_markup=reply_markup,
+                                            parse_mode=ParseMode.MARKDOWN, disable_web_page_preview=True)
+        future.add_done_callback(lambda f: self._on_edit_done(dashboard, f))
+
+    def _on_edit_done(self, dashboard: LiveDashboard, future: asyncio.Future):
+        if future.cancelled() or future.exception() is None:
+            return
+        error = future.exception()
+        if isinstance(error, BadRequest) and "Message is not modified" in str(error):
+            return
+        # 消息已被删除或无法再编辑
+        logger.info(f"停止会话 {dashboard.chat_id} 的实时面板: {error}")
+        if self._dashboards.get(dashboard.chat_id) is dashboard:
+            del self._dashboards[dashboard.chat_id]
+
+    def _pause(self, dashboard: LiveDashboard):
+        del self._dashboards[dashboard.chat_id]
+        keyboard = [[InlineKeyboardButton("▶️ 继续实时刷新", callback_data=f"live:{dashboard.view}:{dashboard.page}")],
+                    [InlineKeyboardButton("⬅️ 返回主菜单", callback_data="back:main")]]
+        keyboard.extend(get_footer_ruler(add_close_button=False))
+        outbound.edit_message_text(dashboard.chat_id, dashboard.message_id, "⏸ 长时间无操作，实时刷新已暂停。", priority=PRIORITY_NOTIFY,
+                                   reply_markup=InlineKeyboardMarkup(keyboard))
+
+live_dashboards = LiveDashboardManager()
+
+Gauge("tgbot_live_dashboards", "Chats with an active live task dashboard.", lambda: len(live_dashboards))
+
+# --- 批量实例操作 ---
+ACTION_TEXT_MAP = {"START": "开机", "STOP": "关机", "RESTART": "重启", "TERMINATE": "终止", "CHANGEIP": "更换IP", "ASSIGNIPV6": "分配IPv6"}
+
+class BulkActionProgress:
+    """
+    一次批量操作的汇总进度。每个实例的状态变化都会重新渲染同一条进度消息，
+    发送队列会合并尚未发出的编辑。
+    """
+    STATUS_TEXT = {"pending": "⏳ 等待提交", "submitted": "🕓 执行中", "success": "✅ 成功", "failure": "❌ 失败", "timeout": "⌛ 超时"}
+
+    def __init__(self, chat_id: int, alias: str, action: str, instances: List[dict]):
+        self.chat_id = chat_id
+        self.alias = alias
+        self.action = action
+        self.message_id = None
+        self.states = {inst['id']: ["pending", inst['display_name'], None] for inst in instances}
+
+    def update(self, instance_id: str, status: str, detail=None):
+        self.states[instance_id][0] = status
+        self.states[instance_id][2] = detail
+        self.render()
+
+    def render(self):
+        if self.message_id is None:
+            return
+        counts = {}
+        for status, _, _ in self.states.values():
+            counts[status] = counts.get(status, 0) + 1
+        finished = counts.get("success", 0) + counts.get("failure", 0) + counts.get("timeout", 0)
+        text = (f"☑️ *批量{ACTION_TEXT_MAP.get(self.action, self.action)}* - 账户 `{self.alias}`\n"
+                f"进度: {finished}/{len(self.states)}  ✅ {counts.get('success', 0)}  ❌ {counts.get('failure', 0) + counts.get('timeout', 0)}\n\n")
+        for status, name, detail in self.states.values():
+            line = f"{self.STATUS_TEXT[status]} `{name}`"
+            if detail: line += f": `{str(detail).replace('`', '')[:80]}`"
+            text += line + "\n"
+        outbound.edit_message_text(self.chat_id, self.message_id, text, priority=PRIORITY_NOTIFY, parse_mode=ParseMode.MARKDOWN)
+
+async def run_bulk_action(chat_id: int, alias: str, action: str, instances: List[dict]):
+    # 在后台运行，不受发起点击的时限约束
+    panel_deadline.set(None)
+    progress = BulkActionProgress(chat_id, alias, action, instances)
+    try:
+        message = await outbound.send_message(chat_id, f"☑️ 正在提交批量操作 ({len(instances)} 个实例)...", priority=PRIORITY_INTERACTIVE)
+    except Exception as e:
+        logger.error(f"发送批量操作进度消息时出错: {e}")
+        return
+    progress.message_id = message.message_id
+    progress.render()
+    semaphore = asyncio.Semaphore(BULK_ACTION_CONCURRENCY)
+
+    async def submit_one(inst: dict):
+        payload = {"action": action, "instance_id": inst['id'], "instance_name": inst['display_name']}
+        if inst.get('vnic_id'): payload['vnic_id'] = inst['vnic_id']
+        async with semaphore:
+            result = await api_request("POST", f"{alias}/instance-action", json=payload)
+        if result and result.get("task_id"):
+            progress.update(inst['id'], "submitted")
+            task_scheduler.track(chat_id, result.get("task_id"), f"{action} on {inst['display_name']}",
+                                 on_finish=lambda status, detail: progress.update(inst['id'], status, detail if status == "failure" else None), alias=alias)
+        else:
+            progress.update(inst['id'], "failure", f"命令发送失败: {result.get('error', '未知错误') if result else '无响应'}")
+
+    await asyncio.gather(*(submit_one(inst) for inst in instances))
+
+async def show_bulk_action_menu(query, context: ContextTypes.DEFAULT_TYPE, alias: str):
+    instances = await api_request("GET", f"{alias}/instances")
+    if not isinstance(instances, list):
+        error_msg = instances.get('error', '未知错误') if isinstance(instances, dict) else '获取失败'
+        asyncio.create_task(send_and_delete_message(context, query.message.chat_id, f"❌ 获取实例列表失败: {error_msg}", "error"))
+        return
+    context.user_data['instance_list'] = [compact_instance(inst) for inst in instances]
+    valid_ids = {inst['id'] for inst in context.user_data['instance_list']}
+    selected = [i for i in context.user_data.get('bulk_selected', []) if i in valid_ids]
+    context.user_data['bulk_selected'] = selected
+    reply_markup, text = build_bulk_action_menu(alias, context.user_data['instance_list'], selected)
+    try:
+        await edit_query_message(query, text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    except BadRequest as e:
+        if "Message is not modified" not in str(e): raise e
+
+async def handle_bulk_callback(update: Update, context: ContextTypes.DEFAULT_TYPE, sub: str, arg: str):
+    query = update.callback_query
+    alias = context.user_data.get('current_alias')
+    chat_id = update.effective_chat.id
+    if not alias:
+        asyncio.create_task(send_and_delete_message(context, chat_id, "❌ 会话已过期，请返回重试。", "error"))
+        return
+    instance_list = context.user_data.get('instance_list') or []
+    selected = context.user_data.setdefault('bulk_selected', [])
+    if sub == "open":
+        context.user_data['bulk_selected'] = []
+    elif sub == "toggle":
+        index = int(arg)
+        if index >= len(instance_list): return
+        instance_id = instance_list[index]['id']
+        if instance_id in selected: selected.remove(instance_id)
+        else: selected.append(instance_id)
+    elif sub == "sel":
+        state = arg
+        if state == "NONE": context.user_data['bulk_selected'] = []
+        elif state == "ALL": context.user_data['bulk_selected'] = [inst['id'] for inst in instance_list]
+        else: context.user_data['bulk_selected'] = [inst['id'] for inst in instance_list if inst.get('lifecycle_state') == state]
+    elif sub == "do":
+        action = arg
+        targets = [inst for inst in instance_list if inst['id'] in set(selected)]
+        if not targets:
+            return
+        action_text = ACTION_TEXT_MAP.get(action, action)
+        if action in ['STOP', 'TERMINATE']:
+            pending = context.user_data.get('pending_confirmation')
+            if not (pending and pending['action'] == f"BULK_{action}" and pending['instance_id'] == alias and (datetime.now() - pending['timestamp']).total_seconds() < 5):
+                context.user_data['pending_confirmation'] = {'action': f"BULK_{action}", 'instance_id': alias, 'timestamp': datetime.now()}
+                warning_text = f"⚠️ *危险操作！* 将对 {len(targets)} 个实例执行 *{action_text}*，请在5秒内再次点击以确认。"
+                asyncio.create_task(send_and_delete_message(context, chat_id, warning_text, "warning"))
+                return
+            context.user_data.pop('pending_confirmation', None)
+        context.user_data['bulk_selected'] = []
+        asyncio.create_task(run_bulk_action(chat_id, alias, action, targets))
+    await show_bulk_action_menu(query, context, alias)
+
+# --- 账户总览 ---
+class FleetOverview:
+    """
+    并发获取所有账户的实例并汇总，结果按账户返回的顺序逐步显示。
+    """
+    MAX_TEXT_LENGTH = 3800
+
+    def __init__(self, aliases: List[str]):
+        self.aliases = aliases
+        self.results: Dict[str, Any] = {}
+
+    def add(self, alias: str, result):
+        self.results[alias] = result
+
+    def render(self) -> str:
+        state_counts: Dict[str, int] = {}
+        shape_counts: Dict[str, int] = {}
+        account_lines, failed_lines = [], []
+        total = 0
+        for alias in self.aliases:
+            if alias not in self.results:
+                continue
+            result = self.results[alias]
+            if not isinstance(result, list):
+                failed_lines.append(f"❌ `{alias}`: {result}")
+                continue
+            running = 0
+            for inst in result:
+                state = inst.get('lifecycle_state', '未知')
+                shape = inst.get('shape') or '未知'
+                state_counts[state] = state_counts.get(state, 0) + 1
+                shape_counts[shape] = shape_counts.get(shape, 0) + 1
+                if state == "RUNNING": running += 1
+            total += len(result)
+            account_lines.append(f"`{alias}`: {len(result)} 台 (运行 {running})")
+        done = len(self.results)
+        text = f"🌐 *账户总览* ({done}/{len(self.aliases)} 个账户已返回)\n\n"
+        text += f"*实例总数*: {total}\n"
+        if state_counts:
+            text += "\n*按状态*:\n" + "\n".join(f"  {state}: {count}" for state, count in sorted(state_counts.items(), key=lambda x: -x[1])) + "\n"
+        if shape_counts:
+            text += "\n*按机型*:\n" + "\n".join(f"  {shape}: {count}" for shape, count in sorted(shape_counts.items(), key=lambda x: -x[1])) + "\n"
+        if failed_lines:
+            text += "\n*获取失败*:\n" + "\n".join(failed_lines) + "\n"
+        if account_lines:
+            text += "\n*账户明细*:\n"
+            for line in account_lines:
+                if len(text) + len(line) > self.MAX_TEXT_LENGTH:
+                    text += "_…其余账户已省略_\n"
+                    break
+                text += line + "\n"
+        if done < len(self.aliases):
+            text += f"\n_正在获取其余 {len(self.aliases) - done} 个账户..._"
+        return text
+
+async def fetch_account_instances(alias: str, semaphore: asyncio.Semaphore):
+    async with semaphore:
+        try:
+            result = await asyncio.wait_for(api_request("GET", f"{alias}/instances"), timeout=FLEET_ACCOUNT_TIMEOUT)
+        except asyncio.TimeoutError:
+            return alias, "超时"
+    if isinstance(result, list):
+        return alias, result
+    return alias, result.get('error', '未知错误') if isinstance(result, dict) else '获取失败'
+
+async def show_fleet_overview(query, context: ContextTypes.DEFAULT_TYPE):
+    keyboard = [[InlineKeyboardButton("🔄 刷新", callback_data="fleet"), InlineKeyboardButton("⬅️ 返回主菜单", callback_data="back:main")]]
+    keyboard.extend(get_footer_ruler(add_close_button=False))
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    profiles = await profile_index.refresh()
+    if not isinstance(profiles, list):
+        error = profiles.get('error', '未知错误') if isinstance(profiles, dict) and profiles else '无响应'
+        await edit_query_message(query, f"❌ 无法从面板获取账户列表: {error}", reply_markup=reply_markup)
+        return
+    overview = FleetOverview(profile_index.aliases)
+    edit_query_message(query, overview.render(), reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    # 逐个账户获取耗时较长，放到后台进行，不占用该会话的处理顺序
+    asyncio.create_task(run_fleet_overview(query, overview, reply_markup))
+
+async def run_fleet_overview(query, overview: FleetOverview, reply_markup: InlineKeyboardMarkup):
+    # 在后台运行，每个账户由 FLEET_ACCOUNT_TIMEOUT 限时，不受发起点击的时限约束
+    panel_deadline.set(None)
+    semaphore = asyncio.Semaphore(FLEET_CONCURRENCY)
+    for next_result in asyncio.as_completed([fetch_account_instances(alias, semaphore) for alias in overview.aliases]):
+        alias, result = await next_result
+        overview.add(alias, result)
+        # 尚未发出的编辑会被合并，账户陆续返回时只发送最新的汇总
+        edit_query_message(query, overview.render(), reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    try:
+        await edit_query_message(query, overview.render(), reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    except BadRequest as e:
+        if "Message is not modified" not in str(e):
+            logger.error(f"编辑账户总览消息时出错: {e}")
+
+# --- 预取 ---
+PREFETCH_RESULTS = Counter("tgbot_prefetch_total", "Prefetch outcomes: hit (a request was served by a prefetch), miss (a request had to wait for the panel), wasted (prefetched data expired unused).", ("result",))
+PREFETCH_REQUESTS = Counter("tgbot_prefetch_requests_total", "Panel requests issued by the prefetcher.", ("endpoint",))
+# 参与命中率统计的接口
+PREFETCH_ENDPOINT_LABELS = ("instances", "tasks/snatch/running")
+
+class Prefetcher:
+    """
+    在后台预取用户接下来可能查看的数据并写入面板读缓存。预取使用独立的低并发额度，
+    接口熔断或积压过多时直接放弃；按命中、未命中和浪费统计效果，便于调整预取策略。
+    """
+    def __init__(self):
+        self._semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+        self._pending: set = set()
+        self._warmed: OrderedDict[str, float] = OrderedDict()  # 已预取、尚未被使用的接口 -> 预取时间
+        self._tasks: set = set()
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def _spawn(self, key: str, coro_factory) -> bool:
+        if not PREFETCH or key in self._pending or len(self._pending) >= PREFETCH_MAX_PENDING:
+            return False
+        self._pending.add(key)
+        task = asyncio.create_task(self._run(key, coro_factory))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return True
+
+    async def _run(self, key: str, coro_factory):
+        # 预取不受触发它的用户操作的时限约束
+        panel_deadline.set(None)
+        try:
+            async with self._semaphore:
+                await coro_factory()
+        except Exception as e:
+            logger.debug(f"预取 {key} 失败: {e}")
+        finally:
+            self._pending.discard(key)
+
+    def warm(self, endpoint: str):
+        if panel_cache.is_fresh(endpoint) or get_breaker(endpoint).is_open:
+            return
+        self._spawn(endpoint, lambda: self._fetch(endpoint))
+
+    async def _fetch(self, endpoint: str):
+        PREFETCH_REQUESTS.inc(endpoint=endpoint_label(endpoint))
+        result = await panel_cache.get(endpoint, lambda: _panel_request("GET", endpoint))
+        if not (isinstance(result, dict) and "error" in result):
+            self._warmed[endpoint] = time.monotonic()
+            self._warmed.move_to_end(endpoint)
+
+    def note_request(self, endpoint: str):
+        """用户操作发起读请求前调用，统计预取是否命中。"""
+        if endpoint_label(endpoint) not in PREFETCH_ENDPOINT_LABELS:
+            return
+        self._expire()
+        warmed = self._warmed.pop(endpoint, None) is not None and panel_cache.is_usable(endpoint)
+        if warmed or endpoint in self._pending:
+            PREFETCH_RESULTS.inc(result="hit")
+        elif not panel_cache.is_usable(endpoint):
+            PREFETCH_RESULTS.inc(result="miss")
+
+    def _expire(self):
+        for endpoint in [e for e in self._warmed if not panel_cache.is_usable(e)]:
+            del self._warmed[endpoint]
+            PREFETCH_RESULTS.inc(result="wasted")
+
+    # 各个预取时机
+    def after_main_menu(self, user_data: dict):
+        for alias in user_data.get('recent_aliases', [])[:PREFETCH_RECENT_ACCOUNTS]:
+            self.warm(f"{alias}/instances")
+        self.warm(TASK_VIEW_ENDPOINTS["running"])
+        if TASK_ARCHIVE:
+            self._spawn("task-archive", task_archive.sync)
+
+    def after_task_page(self, view: str, page: int, items: List[dict] | None = None, task_filter: dict | None = None):
+        """相邻页的数据已在本地 (快照或归档)，预先渲染以填充 TaskFormatter 的缓存。"""
+        if not PREFETCH:
+            return
+        asyncio.get_running_loop().call_soon(self._render_pages, view, page, items, task_filter or {})
+
+    @staticmethod
+    def _render_pages(view: str, page: int, items: List[dict] | None, task_filter: dict):
+        for neighbour in (page + 1, page - 1):
+            if neighbour < 1: continue
+            offset = (neighbour - 1) * TASKS_PER_PAGE
+            if items is not None:
+                tasks = items[offset:offset + TASKS_PER_PAGE]
+            else:
+                tasks = task_archive.query(task_filter.get('alias'), task_filter.get('status'), task_filter.get('range'), offset=offset)
+            for task in tasks:
+                task_formatter.render(task, view)
+
+    def after_instance_action(self, alias: str):
+        # 实例状态已改变，丢弃旧的实例列表并在后台重新获取
+        panel_cache.invalidate(f"{alias}/")
+        self.warm(f"{alias}/instances")
+
+prefetcher = Prefetcher()
+
+Gauge("tgbot_prefetch_pending", "Prefetch jobs queued or running.", lambda: len(prefetcher._pending))
+
 # --- 命令和回调处理器  ---
 @authorized
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    context.user_data.clear()
+    started = time.perf_counter()
+    try:
+        with interaction_deadline():
+            await show_main_menu(update, context)
+    finally:
+        HANDLER_LATENCY.observe(time.perf_counter() - started, command="start")
+
+async def show_main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    reset_session(context.user_data)
     
     if update.callback_query:
         try:
-            await update.callback_query.message.delete()
+            await outbound.delete_message(update.effective_chat.id, update.callback_query.message.message_id, priority=PRIORITY_INTERACTIVE)
         except BadRequest:
             pass
     if update.message:
         try:
-            await update.message.delete()
+            await outbound.delete_message(update.effective_chat.id, update.message.message_id, priority=PRIORITY_INTERACTIVE)
         except BadRequest:
             pass
 
-    reply_markup, text = await build_main_menu()
+    reply_markup, text = await build_main_menu(inline_search=bool(context.bot.supports_inline_queries))
     
-    await update.effective_chat.send_message(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    await outbound.send_message(update.effective_chat.id, text, priority=PRIORITY_INTERACTIVE, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    prefetcher.after_main_menu(context.user_data)
 
 @authorized
 async def button_callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    command = (update.callback_query.data or "").split(":", 1)[0]
+    started = time.perf_counter()
+    try:
+        with interaction_deadline():
+            await handle_callback_query(update, context)
+    finally:
+        HANDLER_LATENCY.observe(time.perf_counter() - started, command=command)
+
+async def handle_callback_query(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = update.callback_query
     await query.answer()
-    if query.data == "ignore": return
-    
-    if query.data == "close_window":
-        try:
-            await query.message.delete()
-        except BadRequest as e:
-            if "Message to delete not found" in str(e):
-                await query.answer("窗口已被关闭。")
-            else:
-                logger.error(f"关闭窗口时出错: {e}")
-                await query.answer("❌ 关闭窗口失败。", show_alert=True)
-        return
+    live_dashboards.on_callback(update.effective_chat.id, query.message.message_id if query.message else None, (query.data or "").split(":", 1)[0])
+    if not await callback_router.dispatch(update, context, query.data or ""):
+        logger.warning(f"未知的回调数据: {query.data}")
 
-    parts = query.data.split(":")
-    command = parts[0]
-    
-    if command == "tasks":
-        view = parts[1] if len(parts) > 1 else 'running'
-        page = int(parts[2]) if len(parts) > 2 else 1
-        await show_all_tasks(query, view, page)
+@authorized
+async def inline_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    started = time.perf_counter()
+    try:
+        with interaction_deadline():
+            await answer_account_search(update.inline_query)
+    finally:
+        HANDLER_LATENCY.observe(time.perf_counter() - started, command="inline")
+
+async def answer_account_search(inline_query):
+    profiles = await profile_index.refresh()
+    matches = profile_index.search(inline_query.query, INLINE_QUERY_RESULTS) if isinstance(profiles, list) else []
+    # 选中结果后会在当前会话发送 "/account 账户名"，由 account_command 打开账户菜单
+    results = [
+        InlineQueryResultArticle(id=str(i), title=alias, description="打开账户菜单", input_message_content=InputTextMessageContent(f"/account {alias}"))
+        for i, alias in enumerate(matches)
+    ]
+    await inline_query.answer(results, cache_time=INLINE_QUERY_CACHE_TIME, is_personal=True)
+
+@authorized
+async def account_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    started = time.perf_counter()
+    try:
+        with interaction_deadline():
+            await open_account_from_message(update, context)
+    finally:
+        HANDLER_LATENCY.observe(time.perf_counter() - started, command="account")
+
+async def open_account_from_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """处理 "/account 账户名"：名称唯一匹配时直接打开账户菜单，否则显示账户选择菜单。"""
+    text = (context.matches[0].group(1) or "").strip() if context.matches else ""
+    await profile_index.refresh()
+    alias = text if text in profile_index else None
+    if alias is None and text:
+        matches = profile_index.search(text, 2)
+        if len(matches) == 1: alias = matches[0]
+    if alias is None:
+        await show_main_menu(update, context)
         return
+    chat_id = update.effective_chat.id
+    try:
+        await outbound.delete_message(chat_id, update.effective_message.message_id, priority=PRIORITY_INTERACTIVE)
+    except BadRequest:
+        pass
+    reset_session(context.user_data)
+    context.user_data['current_alias'] = alias
+    reply_markup, text = await build_account_menu(alias, context)
+    await outbound.send_message(chat_id, text, priority=PRIORITY_INTERACTIVE, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
 
-    if command == "perform_action":
-        action, alias = parts[1], context.user_data.get('current_alias')
-        selected_instance = context.user_data.get('selected_instance_for_action')
-        chat_id = update.effective_chat.id
-        if not all([alias, action, selected_instance]):
-            asyncio.create_task(send_and_delete_message(context, chat_id, "❌ 会话已过期，请返回重试。"))
-            return
-        action_text_map = {"START": "开机", "STOP": "关机", "RESTART": "重启", "TERMINATE": "终止", "CHANGEIP": "更换IP", "ASSIGNIPV6": "分配IPv6"}
-        action_text = action_text_map.get(action, action)
-        if action in ['STOP', 'TERMINATE']:
-            pending = context.user_data.get('pending_confirmation')
-            if (pending and pending['action'] == action and pending['instance_id'] == selected_instance['id'] and (datetime.now() - pending['timestamp']).total_seconds() < 5):
-                context.user_data.pop('pending_confirmation', None)
-                feedback_text = f"✅ *{action_text}* 命令已确认并发送..."
-                asyncio.create_task(send_and_delete_message(context, chat_id, feedback_text))
-            else:
-                context.user_data['pending_confirmation'] = {'action': action, 'instance_id': selected_instance['id'], 'timestamp': datetime.now()}
-                warning_text = f"⚠️ *危险操作！* 请在5秒内再次点击 *{action_text}* 按钮以确认。"
-                asyncio.create_task(send_and_delete_message(context, chat_id, warning_text))
-                return
-        else:
-            feedback_text = f"✅ *{action_text}* 命令已发送..."
-            asyncio.create_task(send_and_delete_message(context, chat_id, feedback_text))
-        
-        instance_id, instance_name, vnic_id = selected_instance['id'], selected_instance['display_name'], selected_instance.get('vnic_id')
-        payload = {"action": action, "instance_id": instance_id, "instance_name": instance_name}
-        if vnic_id: payload['vnic_id'] = vnic_id
-        result = await api_request("POST", f"{alias}/instance-action", json=payload)
-        if result and result.get("task_id"):
-            asyncio.create_task(poll_task_status(chat_id, context, result.get("task_id"), f"{action} on {instance_name}"))
+@callback_router.route("ignore")
+async def on_ignore(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    pass
+
+@callback_router.route("close_window")
+async def on_close_window(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    try:
+        await outbound.delete_message(query.message.chat_id, query.message.message_id, priority=PRIORITY_INTERACTIVE)
+    except BadRequest as e:
+        if "Message to delete not found" in str(e):
+            await query.answer("窗口已被关闭。")
         else:
-            asyncio.create_task(send_and_delete_message(context, chat_id, f"❌ 命令发送失败: {result.get('error', '未知错误')}"))
-        return
+            logger.error(f"关闭窗口时出错: {e}")
+            await query.answer("❌ 关闭窗口失败。", show_alert=True)
 
-    if command == "start_create" or command == "start_snatch":
-        alias = parts[1]
-        context.user_data.clear()
-        context.user_data.update({'action_in_progress': command, 'alias': alias})
-        auto_name = f"snatch-{datetime.now().strftime('%m%d-%H%M')}"
-        context.user_data['form_data'] = {'display_name_prefix': auto_name, 'shape': 'VM.Standard.A1.Flex'}
-        text, reply_markup = await build_param_selection_menu(context.user_data['form_data'], command, context)
-        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+@callback_router.route("tasks", str, int, str)
+async def on_tasks(update: Update, context: ContextTypes.DEFAULT_TYPE, view: str = 'running', page: int = 1, flag: str = ""):
+    if view == "stats" and TASK_ARCHIVE:
+        await show_task_stats(update.callback_query, context)
         return
-        
-    if command == "form_param":
-        key, value = parts[1], parts[2]
-        context.user_data['form_data'][key] = value
-        if key == 'shape': context.user_data['form_data'].pop('ocpus', None); context.user_data['form_data'].pop('memory_in_gbs', None)
-        action_type = context.user_data['action_in_progress']
-        text, reply_markup = await build_param_selection_menu(context.user_data['form_data'], action_type, context)
-        try:
-            await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
-        except BadRequest as e:
-            if "Message is not modified" not in str(e): raise e
+    await show_all_tasks(update.callback_query, context, view, page, flag == "refresh")
+
+@callback_router.route("live", str, int)
+async def on_live(update: Update, context: ContextTypes.DEFAULT_TYPE, view: str = "running", page: int = 1):
+    if view not in TASK_VIEW_ENDPOINTS: view = 'running'
+    await live_dashboards.watch(update.effective_chat.id, update.callback_query.message.message_id, view, page)
+
+@callback_router.route("tf", str, str)
+async def on_task_filter(update: Update, context: ContextTypes.DEFAULT_TYPE, key: str, value: str):
+    task_filter = dict(context.user_data.get('task_filter') or {})
+    allowed = {"status": TASK_ARCHIVE_STATUSES, "range": TASK_ARCHIVE_PERIODS}.get(key)
+    if key not in ("status", "range", "alias") or (allowed is not None and value not in allowed):
         return
+    if value == "all": task_filter.pop(key, None)
+    else: task_filter[key] = value
+    context.user_data['task_filter'] = task_filter
+    await show_all_tasks(update.callback_query, context, 'completed', 1)
 
-    if command == "form_submit":
-        await submit_form(update, context, context.user_data.get('form_data', {}))
+@callback_router.route("perform_action", str)
+async def on_perform_action(update: Update, context: ContextTypes.DEFAULT_TYPE, action: str = ""):
+    alias = context.user_data.get('current_alias')
+    selected_instance = context.user_data.get('selected_instance_for_action')
+    chat_id = update.effective_chat.id
+    if not all([alias, action, selected_instance]):
+        asyncio.create_task(send_and_delete_message(context, chat_id, "❌ 会话已过期，请返回重试。", "error"))
         return
+    action_text = ACTION_TEXT_MAP.get(action, action)
+    if action in ['STOP', 'TERMINATE']:
+        pending = context.user_data.get('pending_confirmation')
+        if (pending and pending['action'] == action and pending['instance_id'] == selected_instance['id'] and (datetime.now() - pending['timestamp']).total_seconds() < 5):
+            context.user_data.pop('pending_confirmation', None)
+            feedback_text = f"✅ *{action_text}* 命令已确认并发送..."
+            asyncio.create_task(send_and_delete_message(context, chat_id, feedback_text, "feedback"))
+        else:
+            context.user_data['pending_confirmation'] = {'action': action, 'instance_id': selected_instance['id'], 'timestamp': datetime.now()}
+            warning_text = f"⚠️ *危险操作！* 请在5秒内再次点击 *{action_text}* 按钮以确认。"
+            asyncio.create_task(send_and_delete_message(context, chat_id, warning_text, "warning"))
+            return
+    else:
+        feedback_text = f"✅ *{action_text}* 命令已发送..."
+        asyncio.create_task(send_and_delete_message(context, chat_id, feedback_text, "feedback"))
 
-    if command == "account":
-        alias = parts[1]
-        context.user_data['current_alias'] = alias
-        await query.edit_message_text(f"正在为账户 *{alias}* 加载实例列表...", parse_mode=ParseMode.MARKDOWN)
-        reply_markup, text = await build_account_menu(alias, context)
-        await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    instance_id, instance_name, vnic_id = selected_instance['id'], selected_instance['display_name'], selected_instance.get('vnic_id')
+    payload = {"action": action, "instance_id": instance_id, "instance_name": instance_name}
+    if vnic_id: payload['vnic_id'] = vnic_id
+    result = await api_request("POST", f"{alias}/instance-action", json=payload)
+    if result and result.get("task_id"):
+        task_scheduler.track(chat_id, result.get("task_id"), f"{action} on {instance_name}", alias=alias)
+    else:
+        asyncio.create_task(send_and_delete_message(context, chat_id, f"❌ 命令发送失败: {result.get('error', '未知错误')}", "error"))
+
+@callback_router.route("fleet")
+async def on_fleet(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await show_fleet_overview(update.callback_query, context)
+
+@callback_router.route("start_create", str)
+@callback_router.route("start_snatch", str)
+async def on_start_form(update: Update, context: ContextTypes.DEFAULT_TYPE, alias: str):
+    command = update.callback_query.data.split(":", 1)[0]
+    reset_session(context.user_data)
+    context.user_data.update({'action_in_progress': command, 'alias': alias})
+    auto_name = f"snatch-{datetime.now().strftime('%m%d-%H%M')}"
+    context.user_data['form_data'] = {'display_name_prefix': auto_name, 'shape': 'VM.Standard.A1.Flex'}
+    text, reply_markup = await build_param_selection_menu(context.user_data['form_data'], command, context)
+    await edit_query_message(update.callback_query, text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+
+@callback_router.route("form_param", str, str)
+async def on_form_param(update: Update, context: ContextTypes.DEFAULT_TYPE, key: str, value: str):
+    if 'form_data' not in context.user_data:
+        asyncio.create_task(send_and_delete_message(context, update.effective_chat.id, "❌ 会话已过期，请返回重试。", "error"))
         return
+    context.user_data['form_data'][key] = value
+    if key == 'shape': context.user_data['form_data'].pop('ocpus', None); context.user_data['form_data'].pop('memory_in_gbs', None)
+    action_type = context.user_data['action_in_progress']
+    text, reply_markup = await build_param_selection_menu(context.user_data['form_data'], action_type, context)
+    try:
+        await edit_query_message(update.callback_query, text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    except BadRequest as e:
+        if "Message is not modified" not in str(e): raise e
 
-    if command == "exec":
-        instance_index, alias = int(parts[1]), context.user_data.get('current_alias')
-        instance_list = context.user_data.get('instance_list')
-        if not all([alias, instance_list is not None]):
-            await query.answer("会话已过期或信息不完整，请返回重试。", show_alert=True)
-            return
-        selected_instance = instance_list[instance_index]
-        context.user_data['selected_instance_for_action'] = selected_instance
-        reply_markup, text = await build_instance_action_menu(alias)
-        await query.edit_message_text(f"已选择实例: *{selected_instance['display_name']}*\n请选择要执行的操作：", reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+@callback_router.route("form_submit")
+async def on_form_submit(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await submit_form(update, context, context.user_data.get('form_data', {}))
+
+@callback_router.route("main", int)
+async def on_main_page(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 1):
+    reply_markup, text = await build_main_menu(page, inline_search=bool(context.bot.supports_inline_queries))
+    try:
+        await edit_query_message(update.callback_query, text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    except BadRequest as e:
+        if "Message is not modified" not in str(e): raise e
+    prefetcher.after_main_menu(context.user_data)
+
+@callback_router.route("account", str)
+async def on_account(update: Update, context: ContextTypes.DEFAULT_TYPE, alias: str):
+    query = update.callback_query
+    context.user_data['current_alias'] = alias
+    if not panel_cache.is_usable(f"{alias}/instances"):
+        edit_query_message(query, f"正在为账户 *{alias}* 加载实例列表...", parse_mode=ParseMode.MARKDOWN)
+    reply_markup, text = await build_account_menu(alias, context)
+    await edit_query_message(query, text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+
+@callback_router.route("exec", int)
+async def on_exec(update: Update, context: ContextTypes.DEFAULT_TYPE, instance_index: int):
+    query = update.callback_query
+    alias = context.user_data.get('current_alias')
+    instance_list = context.user_data.get('instance_list')
+    if not all([alias, instance_list is not None]) or instance_index >= len(instance_list):
+        await query.answer("会话已过期或信息不完整，请返回重试。", show_alert=True)
         return
-    
-    if command == "back":
-        target = parts[1]
-        if target == "main":
-            await start_command(update, context)
-        elif target == "account":
-            alias = parts[2] if len(parts) > 2 else context.user_data.get('current_alias')
-            context.user_data.clear()
-            context.user_data['current_alias'] = alias
-            await query.edit_message_text(f"正在为账户 *{alias}* 加载实例列表...", parse_mode=ParseMode.MARKDOWN)
-            reply_markup, text = await build_account_menu(alias, context)
-            await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    selected_instance = instance_list[instance_index]
+    context.user_data['selected_instance_for_action'] = selected_instance
+    reply_markup, text = build_instance_action_menu(alias)
+    await edit_query_message(query, f"已选择实例: *{selected_instance['display_name']}*\n请选择要执行的操作：", reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+
+@callback_router.route("bulk", str, str)
+async def on_bulk(update: Update, context: ContextTypes.DEFAULT_TYPE, sub: str = "open", arg: str = ""):
+    await handle_bulk_callback(update, context, sub, arg)
+
+@callback_router.route("back", str, str)
+async def on_back(update: Update, context: ContextTypes.DEFAULT_TYPE, target: str, alias: str = ""):
+    query = update.callback_query
+    if target == "main":
+        await show_main_menu(update, context)
+    elif target == "account":
+        alias = alias or context.user_data.get('current_alias')
+        reset_session(context.user_data)
+        context.user_data['current_alias'] = alias
+        if not panel_cache.is_usable(f"{alias}/instances"):
+            edit_query_message(query, f"正在为账户 *{alias}* 加载实例列表...", parse_mode=ParseMode.MARKDOWN)
+        reply_markup, text = await build_account_menu(alias, context)
+        await edit_query_message(query, text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
 
 # --- 表单提交和主程序入口 ---
 async def submit_form(update: Update, context: ContextTypes.DEFAULT_TYPE, form_data: dict):
@@ -522,27 +2900,111 @@ async def submit_form(update: Update, context: ContextTypes.DEFAULT_TYPE, form_d
             try:
                 payload[key] = float(payload[key]) if key in ['ocpus', 'memory_in_gbs'] else int(payload[key])
             except (ValueError, TypeError):
-                await send_and_delete_message(context, chat_id, f"❌ 参数 {key} 的值 `{payload[key]}` 无效。")
+                await send_and_delete_message(context, chat_id, f"❌ 参数 {key} 的值 `{payload[key]}` 无效。", "error")
                 return
     payload.setdefault('os_name_version', 'Canonical Ubuntu-22.04')
     action_type = context.user_data.get('action_in_progress')
     endpoint = "snatch-instance" if action_type == "start_snatch" else "create-instance"
     task_name = payload.get('display_name_prefix', 'N/A')
     result = await api_request("POST", f"{alias}/{endpoint}", json=payload)
-    await update.callback_query.delete_message()
+    await outbound.delete_message(chat_id, update.callback_query.message.message_id, priority=PRIORITY_INTERACTIVE)
     if result and result.get("task_id"):
         task_id = result.get("task_id")
         start_message = f"✅ *抢占任务已提交!*\n\n*账户*: `{alias}`\n*任务名称*: `{task_name}`\n\n机器人将在后台开始尝试..."
-        asyncio.create_task(send_and_delete_message(context, chat_id, start_message))
-        asyncio.create_task(poll_task_status(chat_id, context, task_id, task_name))
+        asyncio.create_task(send_and_delete_message(context, chat_id, start_message, "submitted"))
+        task_scheduler.track(chat_id, task_id, task_name, alias=alias)
     else:
         error_message = f"❌ 任务提交失败: {result.get('error', '未知错误')}"
-        asyncio.create_task(send_and_delete_message(context, chat_id, error_message))
-    context.user_data.clear()
-    asyncio.create_task(send_and_delete_message(context, chat_id, "正在返回账户菜单..."))
+        asyncio.create_task(send_and_delete_message(context, chat_id, error_message, "error"))
+    reset_session(context.user_data)
+    asyncio.create_task(send_and_delete_message(context, chat_id, "正在返回账户菜单...", "nav"))
     context.user_data['current_alias'] = alias
     reply_markup, text = await build_account_menu(alias, context)
-    await context.bot.send_message(chat_id=chat_id, text=text, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+    await outbound.send_message(chat_id, text, priority=PRIORITY_INTERACTIVE, reply_markup=reply_markup, parse_mode=ParseMode.MARKDOWN)
+
+# --- 更新并发处理 ---
+class ChatSerialUpdateProcessor(BaseUpdateProcessor):
+    """
+    不同会话的更新并发处理，同一会话 (私聊即同一用户) 的更新按到达顺序逐个处理，
+    保证对 context.user_data 的修改不会交错。全局并发名额在取得会话锁之后才占用，
+    某个会话积压的更新不会挤占其他用户的处理名额。
+    """
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks: Dict[Any, list] = {}  # key -> [锁, 持有或等待该锁的更新数]
+        self.in_flight = 0
+
+    def __len__(self):
+        return len(self._chat_locks)
+
+    @staticmethod
+    def _serial_key(update: object):
+        if not isinstance(update, Update): return None
+        if update.effective_chat is not None: return update.effective_chat.id
+        if update.effective_user is not None: return f"user:{update.effective_user.id}"
+        return None
+
+    async def process_update(self, update: object, coroutine) -> None:
+        # 不使用基类先占名额再处理的方式：等待会话锁的更新不占用并发名额
+        key = self._serial_key(update)
+        if key is None:
+            async with self._semaphore:
+                await self.do_process_update(update, coroutine)
+            return
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0], self._semaphore:
+                await self.do_process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chat_locks[key]
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        self.in_flight += 1
+        try:
+            await coroutine
+        finally:
+            self.in_flight -= 1
+
+    async def initialize(self) -> None: pass
+    async def shutdown(self) -> None: pass
+
+update_processor = ChatSerialUpdateProcessor(MAX_CONCURRENT_UPDATES)
+
+class BoundedUpdateQueue(asyncio.Queue):
+    """
+    Application 的更新队列。并发处理时 PTB 取出更新后立即为其创建任务，队列本身不会积压；
+    这里在已取出但尚未处理完 (task_done) 的更新达到上限时暂停取出，
+    队列随之填满，长轮询和 Webhook 写入新更新时就会等待。
+    """
+    def __init__(self, maxsize: int, max_pending: int):
+        super().__init__(maxsize)
+        self.max_pending = max_pending
+        self.pending = 0
+        self._drained = asyncio.Event()
+
+    async def get(self):
+        while self.pending >= self.max_pending:
+            self._drained.clear()
+            await self._drained.wait()
+        return await super().get()
+
+    def get_nowait(self):
+        item = super().get_nowait()
+        self.pending += 1
+        return item
+
+    def task_done(self):
+        super().task_done()
+        self.pending = max(0, self.pending - 1)
+        self._drained.set()
+
+Gauge("tgbot_updates_in_flight", "Updates currently being handled by the concurrent update processor.", lambda: update_processor.in_flight)
+Gauge("tgbot_update_chats_pending", "Chats with updates in progress or waiting on their per-chat lock.", lambda: len(update_processor))
 
 # --- 修改点 2: 彻底修正左下角菜单按钮的行为 ---
 async def post_init(application: Application):
@@ -551,21 +3013,97 @@ async def post_init(application: Application):
     """
     # 1. 定义一个对用户可见的命令列表
     commands = [
-        BotCommand("start", "主菜单")  # 将描述文字直接放在这里
+        BotCommand("start", "主菜单"),  # 将描述文字直接放在这里
+        BotCommand("account", "打开指定账户，例如 /account 账户名"),
     ]
     await application.bot.set_my_commands(commands)
     
     #    将左下角的菜单按钮明确设置为默认类型。
     #    这会告诉客户端显示一个通用的菜单图标 (≡)，
-    #    点击后，由于我们只有一个命令，它会直接发送 /start
+    #    点击后会列出上面定义的命令
     await application.bot.set_chat_menu_button(menu_button=MenuButtonDefault())
 
-def main() -> None:
-    application = Application.builder().token(BOT_TOKEN).post_init(post_init).build()
+    # 启动本地指标接口
+    application.bot_data['metrics_server'] = await start_metrics_server()
+    # 定期清理闲置的用户会话
+    if isinstance(application.persistence, SQLitePersistence):
+        application.persistence.start_sweeper(application)
+    # 启动 Telegram 发送队列
+    outbound.start(application.bot)
+    # 启动临时消息删除调度器 (会恢复重启前未完成的删除)
+    deletion_scheduler.start()
+    # 预先创建面板 API 的共享连接池
+    get_panel_client()
+    # 启动统一的任务状态调度器，并订阅面板的任务事件流
+    task_scheduler.start()
+    task_events.start()
+    # 启动实时任务面板的刷新协程
+    live_dashboards.start()
+
+async def post_shutdown(application: Application):
+    """
+    在机器人退出时，释放共享的资源。
+    """
+    metrics_server = application.bot_data.get('metrics_server')
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+    await live_dashboards.stop()
+    await prefetcher.stop()
+    await task_events.stop()
+    await task_scheduler.stop()
+    await deletion_scheduler.stop()
+    await outbound.stop()
+    await close_panel_client()
+    close_db()
+
+def build_application(base_url: str | None = None) -> Application:
+    """
+    创建并注册好所有处理器的 Application。base_url 用于指向其他 Bot API 服务 (例如压测用的模拟服务)。
+    """
+    builder = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .update_queue(BoundedUpdateQueue(UPDATE_QUEUE_SIZE, MAX_PENDING_UPDATES))
+        .concurrent_updates(update_processor)
+        .request(InstrumentedHTTPXRequest(connection_pool_size=256))
+        .get_updates_request(InstrumentedHTTPXRequest(connection_pool_size=1))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+    )
+    if base_url:
+        builder.base_url(base_url)
+    if SESSION_PERSISTENCE:
+        builder.persistence(SQLitePersistence())
+    application = builder.build()
     application.add_handler(CommandHandler("start", start_command))
     application.add_handler(CallbackQueryHandler(button_callback_handler))
-    logger.info("Bot 启动成功！")
-    application.run_polling()
+    application.add_handler(InlineQueryHandler(inline_query_handler))
+    # 通过内联查询结果发送的 "/account 账户名" 不一定带有命令实体，因此按文本匹配；编辑过的消息不处理
+    application.add_handler(MessageHandler(filters.UpdateType.MESSAGE & filters.TEXT & filters.Regex(r"^/account(?:@\w+)?(?:\s+(.+))?$"), account_command))
+    return application
+
+def main() -> None:
+    if BOT_MODE == "webhook" and not WEBHOOK_URL:
+        # 监听地址通常是本机地址，Telegram 无法访问，不能用来生成 Webhook 地址
+        logger.error("Webhook 模式需要设置 WEBHOOK_URL (对外的 https 地址)，机器人未启动。")
+        raise SystemExit(1)
+    application = build_application()
+    if BOT_MODE == "webhook":
+        secret_token = WEBHOOK_SECRET_TOKEN or secrets.token_urlsafe(32)
+        logger.info(f"Bot 启动成功！Webhook 模式，监听 {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=secret_token,
+            max_connections=WEBHOOK_MAX_CONNECTIONS,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        logger.info("Bot 启动成功！")
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    """让 get_db() 使用临时数据库，测试结束后关闭连接。"""
+    monkeypatch.setattr(bot, "DB_PATH", str(tmp_path / "test.db"))
+    monkeypatch.setattr(bot, "_db_conn", None)
+    yield
+    if bot._db_conn is not None:
+        bot._db_conn.close()
+    bot._db_conn = None
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的 time.monotonic()。"""
+    class Clock:
+        now = 1000.0
+
+        def advance(self, seconds):
+            self.now += seconds
+
+    fake = Clock()
+    monkeypatch.setattr(bot.time, "monotonic", lambda: fake.now)
+    return fake
@@ -0,0 +1,48 @@
+import pytest
+
+import bot
+
+
+def roundtrip(codec, command, *args):
+    data = codec.encode(command, *args)
+    assert len(data.encode("utf-8")) <= bot.CALLBACK_DATA_LIMIT
+    name, *raw_args = data.split(":")
+    return name, [codec.decode(raw) for raw in raw_args]
+
+
+def test_short_args_are_kept_inline(temp_db):
+    codec = bot.CallbackCodec()
+    assert codec.encode("tasks", "running", 2) == "tasks:running:2"
+    assert codec.decode("running") == "running"
+
+
+def test_long_alias_roundtrip(temp_db):
+    codec = bot.CallbackCodec()
+    alias = "生产环境-" + "x" * 80
+    assert roundtrip(codec, "account", alias) == ("account", [alias])
+    # 同一个值始终得到同一个短 ID
+    assert codec.encode("account", alias) == codec.encode("account", alias)
+
+
+@pytest.mark.parametrize("value", ["us:east", "~literal", "a:b:c"])
+def test_separator_and_prefix_are_escaped(temp_db, value):
+    codec = bot.CallbackCodec()
+    assert codec.encode("account", value).count(":") == 1
+    assert roundtrip(codec, "account", value) == ("account", [value])
+
+
+def test_many_medium_args_fit_the_limit(temp_db):
+    codec = bot.CallbackCodec()
+    args = ["a" * 20, "b" * 20, "c" * 20, "d" * 20]
+    assert roundtrip(codec, "tf", *args) == ("tf", args)
+
+
+def test_ids_survive_restart(temp_db):
+    alias = "tenant-" + "y" * 60
+    short_id = bot.CallbackCodec().encode("account", alias).split(":")[1]
+    assert bot.CallbackCodec().decode(short_id) == alias
+
+
+def test_unknown_id_raises(temp_db):
+    with pytest.raises(KeyError):
+        bot.CallbackCodec().decode("~zzzz")
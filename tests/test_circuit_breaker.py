@@ -0,0 +1,73 @@
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    monkeypatch.setattr(bot, "PANEL_BREAKER_FAILURES", 3)
+    monkeypatch.setattr(bot, "PANEL_BREAKER_RESET", 30)
+    return bot.CircuitBreaker()
+
+
+def trip(breaker):
+    for _ in range(bot.PANEL_BREAKER_FAILURES):
+        assert breaker.allow()
+        breaker.record(False)
+
+
+def test_opens_after_consecutive_failures(breaker):
+    breaker.record(False)
+    breaker.record(False)
+    assert not breaker.is_open
+    breaker.record(False)
+    assert breaker.is_open
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+
+
+def test_success_resets_failure_count(breaker):
+    breaker.record(False)
+    breaker.record(False)
+    breaker.record(True)
+    breaker.record(False)
+    assert not breaker.is_open
+    assert breaker.failures == 1
+
+
+def test_neutral_results_are_ignored(breaker):
+    trip(breaker)
+    breaker.record(None)
+    assert breaker.is_open
+
+
+def test_half_open_allows_a_single_probe(breaker, clock):
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.allow()
+    assert not breaker.allow()
+
+
+def test_successful_probe_closes(breaker, clock):
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.record(True)
+    assert not breaker.is_open
+    assert breaker.failures == 0
+    assert breaker.allow()
+
+
+def test_failed_probe_reopens(breaker, clock):
+    trip(breaker)
+    clock.advance(30)
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.is_open
+    assert breaker.retry_after() == 30
+    assert not breaker.allow()
+
+
+def test_batch_status_has_its_own_breaker():
+    assert bot.get_breaker("task-status/1") is bot.get_breaker("task-status/2")
+    assert bot.get_breaker(bot.PANEL_BATCH_STATUS_ENDPOINT) is not bot.get_breaker("task-status/1")
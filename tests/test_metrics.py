@@ -0,0 +1,34 @@
+import bot
+
+
+def test_histogram_collect():
+    histogram = bot.Histogram("test_latency_seconds", "Test latency.", ("method",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        histogram.observe(value, method="get")
+    histogram.observe(0.2, method="post")
+    assert histogram.collect() == [
+        "# HELP test_latency_seconds Test latency.",
+        "# TYPE test_latency_seconds histogram",
+        'test_latency_seconds_bucket{method="get",le="0.1"} 1',
+        'test_latency_seconds_bucket{method="get",le="1"} 2',
+        'test_latency_seconds_bucket{method="get",le="+Inf"} 3',
+        'test_latency_seconds_sum{method="get"} 5.55',
+        'test_latency_seconds_count{method="get"} 3',
+        'test_latency_seconds_bucket{method="post",le="0.1"} 0',
+        'test_latency_seconds_bucket{method="post",le="1"} 1',
+        'test_latency_seconds_bucket{method="post",le="+Inf"} 1',
+        'test_latency_seconds_sum{method="post"} 0.2',
+        'test_latency_seconds_count{method="post"} 1',
+    ]
+
+
+def test_histogram_without_observations_has_only_headers():
+    histogram = bot.Histogram("test_empty_seconds", "Empty.")
+    assert histogram.collect() == ["# HELP test_empty_seconds Empty.", "# TYPE test_empty_seconds histogram"]
+
+
+def test_counter_collect():
+    counter = bot.Counter("test_events_total", "Events.", ("result",))
+    counter.inc(result="hit")
+    counter.inc(2, result="hit")
+    assert counter.collect()[2:] == ['test_events_total{result="hit"} 3.0']
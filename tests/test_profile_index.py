@@ -0,0 +1,40 @@
+import pytest
+
+import bot
+
+
+@pytest.fixture
+def index():
+    index = bot.ProfileIndex()
+    index._rebuild(["prod-10", "prod-2", "Prod-1", "staging", "old-prod", "dev"])
+    return index
+
+
+def test_prefix_matches_come_first_in_natural_order(index):
+    assert index.search("prod", 10) == ["Prod-1", "prod-2", "prod-10", "old-prod"]
+
+
+def test_search_is_case_insensitive_and_trims(index):
+    assert index.search("  STAG ", 10) == ["staging"]
+
+
+def test_substring_only_matches(index):
+    assert index.search("ing", 10) == ["staging"]
+    assert index.search("-", 10) == ["old-prod", "Prod-1", "prod-2", "prod-10"]
+
+
+def test_limit(index):
+    assert index.search("prod", 2) == ["Prod-1", "prod-2"]
+
+
+def test_empty_query_lists_accounts(index):
+    assert index.search("", 3) == index.aliases[:3]
+
+
+def test_no_match(index):
+    assert index.search("zzz", 10) == []
+
+
+def test_contains(index):
+    assert "staging" in index
+    assert "stag" not in index
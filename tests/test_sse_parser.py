@@ -0,0 +1,36 @@
+import bot
+
+
+def feed_all(parser, lines):
+    return [event for event in map(parser.feed, lines) if event is not None]
+
+
+def test_single_event():
+    parser = bot.SSEParser()
+    events = feed_all(parser, ['event: task', 'id: 7', 'data: {"task_id": "1"}', ''])
+    assert events == [("task", '{"task_id": "1"}')]
+    assert parser.last_event_id == "7"
+
+
+def test_multiline_data_and_default_type():
+    parser = bot.SSEParser()
+    assert feed_all(parser, ["data: a", "data:b", ""]) == [("message", "a\nb")]
+
+
+def test_comments_and_blank_lines_without_data_are_ignored():
+    parser = bot.SSEParser()
+    assert feed_all(parser, [": ping", "", "", "event: task", ""]) == []
+    # 没有数据的事件不会影响下一个事件的类型
+    assert feed_all(parser, ["data: x", ""]) == [("message", "x")]
+
+
+def test_retry_and_invalid_fields():
+    parser = bot.SSEParser(last_event_id="3", retry=1.0)
+    feed_all(parser, ["retry: 2500", "retry: soon", "id: bad\0id", "unknown: value"])
+    assert parser.retry == 2.5
+    assert parser.last_event_id == "3"
+
+
+def test_field_without_value():
+    parser = bot.SSEParser()
+    assert feed_all(parser, ["data", ""]) == [("message", "")]